@@ -0,0 +1,21 @@
+"""
+Makes the plugin importable as package ``qgis2wegue`` from the
+benchmark scripts, independent of the name of the checkout
+"""
+
+import importlib.util
+import os
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def register():
+    if "qgis2wegue" in sys.modules:
+        return
+    spec = importlib.util.spec_from_file_location(
+        "qgis2wegue", os.path.join(PLUGIN_DIR, "__init__.py"),
+        submodule_search_locations=[PLUGIN_DIR])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["qgis2wegue"] = module
+    spec.loader.exec_module(module)
@@ -0,0 +1,168 @@
+"""
+Benchmark of the capabilities parser
+
+Parses a synthetic WMS 1.1.1 capabilities document with many layers
+(20,000 by default) with wegue_capabilities and, for comparison, with
+OWSLib if it is installed, otherwise with a full ElementTree tree,
+which is what OWSLib builds. Does not need QGIS.
+
+The end-to-end rows simulate the download: the document is produced
+piece by piece like network reads and either buffered completely before
+parsing (readAll) or fed to CapabilitiesParser as it arrives, stopping
+the download once the parser is done. Their peak includes the received
+bytes held in memory.
+
+    python benchmarks/bench_capabilities.py [number of layers]
+"""
+
+import sys
+import time
+import tracemalloc
+from xml.etree import ElementTree
+
+import _plugin
+
+_plugin.register()
+
+from qgis2wegue.wegue_capabilities import (  # noqa: E402
+    CapabilitiesParser, parse_capabilities)
+
+try:
+    from owslib.wms import WebMapService
+except ImportError:
+    WebMapService = None
+
+_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<WMT_MS_Capabilities version="1.1.1"
+    xmlns:xlink="http://www.w3.org/1999/xlink">
+<Service><Name>OGC:WMS</Name><Title>Benchmark</Title></Service>
+<Capability>
+<Request>
+<GetCapabilities><Format>application/vnd.ogc.wms_xml</Format>
+<DCPType><HTTP><Get><OnlineResource
+    xlink:href="https://example.com/wms?"/></Get></HTTP></DCPType>
+</GetCapabilities>
+<GetMap><Format>image/png</Format><Format>image/jpeg</Format>
+<DCPType><HTTP><Get><OnlineResource
+    xlink:href="https://example.com/wms?"/></Get></HTTP></DCPType>
+</GetMap>
+</Request>
+<Exception><Format>application/vnd.ogc.se_xml</Format></Exception>
+<Layer><Title>Root</Title><SRS>EPSG:3857</SRS>
+<LatLonBoundingBox minx="-180" miny="-90" maxx="180" maxy="90"/>
+"""
+
+_LAYER = """<Layer queryable="1"><Name>layer_{0}</Name>
+<Title>Layer {0}</Title><Abstract>Synthetic layer number {0}</Abstract>
+<SRS>EPSG:4326</SRS><SRS>EPSG:3857</SRS>
+<LatLonBoundingBox minx="{1}" miny="{2}" maxx="{3}" maxy="{4}"/>
+<BoundingBox SRS="EPSG:4326" minx="{1}" miny="{2}" maxx="{3}" maxy="{4}"/>
+<Style><Name>default</Name><Title>Default</Title></Style>
+</Layer>
+"""
+
+_FOOTER = """</Layer>
+</Capability>
+</WMT_MS_Capabilities>
+"""
+
+
+def _parts(count):
+    yield _HEADER
+    for i in range(count):
+        x = -180 + (i % 360)
+        y = -90 + (i % 180)
+        yield _LAYER.format(i, x, y, x + 1, y + 1)
+    yield _FOOTER
+
+
+def build_document(count):
+    return "".join(_parts(count)).encode("utf-8")
+
+
+def download(count, piece_size=16 * 1024):
+    """Yields the document in pieces as a network reply would"""
+
+    buffer = []
+    size = 0
+    for part in _parts(count):
+        buffer.append(part)
+        size += len(part)
+        if size >= piece_size:
+            yield "".join(buffer).encode("utf-8")
+            buffer = []
+            size = 0
+    yield "".join(buffer).encode("utf-8")
+
+
+def buffered(count):
+    """Downloads the whole document, then parses it"""
+
+    return parse_capabilities(b"".join(download(count)))
+
+
+def streamed(count):
+    """Parses while downloading and stops the download when done"""
+
+    parser = CapabilitiesParser()
+    for piece in download(count):
+        if parser.feed(piece):
+            break
+    return parser.close()
+
+
+def measure(label, func, repeat=3):
+    """Prints the best time of several runs and the memory peak"""
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print("{:<40} {:8.3f} s {:8.2f} MB peak".format(
+        label, best, peak / 1e6))
+
+
+def full_tree(document):
+    root = ElementTree.fromstring(document)
+    return {
+        layer.findtext("Name"): layer.find("LatLonBoundingBox")
+        for layer in root.iter("Layer")}
+
+
+def main(count=20000):
+    document = build_document(count)
+    last_layer = "layer_{}".format(count - 1)
+    print("{} layers, {:.1f} MB".format(count, len(document) / 1e6))
+
+    if WebMapService is not None:
+        measure("OWSLib WebMapService",
+                lambda: WebMapService("https://example.com/wms",
+                                      version="1.1.1", xml=document))
+    else:
+        print("OWSLib not installed, comparing with a full tree")
+        measure("full ElementTree tree", lambda: full_tree(document))
+
+    measure("streaming, GetMap URL only",
+            lambda: parse_capabilities(document))
+    measure("streaming, GetMap + GetLegendGraphic",
+            lambda: parse_capabilities(
+                document, operations=("GetMap", "GetLegendGraphic")))
+    measure("streaming, bbox of the last layer",
+            lambda: parse_capabilities(document, layers=[last_layer]))
+    measure("streaming, bboxes of all layers",
+            lambda: parse_capabilities(document, need_layers=True))
+
+    del document
+    measure("download buffered, then parsed", lambda: buffered(count))
+    measure("download parsed while streaming", lambda: streamed(count))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,139 @@
+"""
+Benchmark of the configuration model against the OrderedDict layers
+it replaced
+
+Builds a configuration with many WMS layers (50,000 by default) twice:
+with the former OrderedDict based _make_layer_json plus json.dump and
+with the typed __slots__ model plus write_json. Compares the tracemalloc
+peak of building and writing, the times of both steps and schema
+validation. Does not need QGIS.
+
+    python benchmarks/bench_model.py [number of layers]
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import _plugin
+
+_plugin.register()
+
+from qgis2wegue.wegueConf import WegueConfiguration  # noqa: E402
+from qgis2wegue.wegueConfUtils import (_create_layer_id,  # noqa: E402
+                                       create_wms)
+from qgis2wegue.wegue_model import write_json  # noqa: E402
+from qgis2wegue.wegue_validation import validate_wegue_conf  # noqa: E402
+
+
+class _NullWriter:
+    """File object discarding everything, the output is not measured"""
+
+    def write(self, text):
+        pass
+
+
+def _legacy_layer(wegue_layer_type, name, url, props):
+    """_make_layer_json as it was before the model, three dicts a layer"""
+
+    props = OrderedDict(props)
+    props['name'] = name
+    props['url'] = url
+    props["type"] = wegue_layer_type
+    if "lid" not in props:
+        props["lid"] = _create_layer_id(props["name"])
+
+    first_keys = ["type", "name", "url", "lid"]
+    if "format" in props:
+        first_keys.append("format")
+    for key in reversed(first_keys):
+        props.move_to_end(key)
+
+    tmp = OrderedDict()
+    for key in reversed(props):
+        tmp[key] = props[key]
+    return tmp
+
+
+def _layer_args(i):
+    return ("Layer {}".format(i), "https://example.com/wms?",
+            "layer_{}".format(i))
+
+
+def build_legacy(count):
+    conf = WegueConfiguration().to_dict()
+    conf["mapLayers"] = [
+        _legacy_layer("WMS", name, url, {
+            "layers": layers, "minResolution": 0.5,
+            "maxResolution": 500.0})
+        for name, url, layers in map(_layer_args, range(count))]
+    return conf
+
+
+def build_model(count):
+    conf = WegueConfiguration()
+    conf.mapLayers = [
+        create_wms(name, url, layers, minResolution=0.5,
+                   maxResolution=500.0)
+        for name, url, layers in map(_layer_args, range(count))]
+    return conf
+
+
+def write_legacy(conf):
+    json.dump(conf, _NullWriter(), indent=2, ensure_ascii=False)
+
+
+def write_model(conf):
+    write_json(conf, _NullWriter())
+
+
+def peak(build, write, count):
+    """Peak of building and writing a configuration in MB"""
+
+    tracemalloc.start()
+    write(build(count))
+    result = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result / 1e6
+
+
+def best_time(func, repeat=3):
+    """Best time of several runs in seconds"""
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(count=50000):
+    print("{} WMS layers".format(count))
+    print("{:<24} {:>12} {:>12}".format("", "OrderedDict", "model"))
+
+    def row(label, legacy, model, unit):
+        print("{:<24} {:>9.3f} {:<2} {:>9.3f} {:<2}".format(
+            label, legacy, unit, model, unit))
+
+    row("peak build + write", peak(build_legacy, write_legacy, count),
+        peak(build_model, write_model, count), "MB")
+
+    legacy = build_legacy(count)
+    model = build_model(count)
+    assert validate_wegue_conf(legacy) == []
+    assert validate_wegue_conf(model) == []
+
+    row("build", best_time(lambda: build_legacy(count)),
+        best_time(lambda: build_model(count)), "s")
+    row("write", best_time(lambda: write_legacy(legacy)),
+        best_time(lambda: write_model(model)), "s")
+    row("validate", best_time(lambda: validate_wegue_conf(legacy)),
+        best_time(lambda: validate_wegue_conf(model)), "s")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -1,8 +1,8 @@
 import re
 import os.path
 
-from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication
-from qgis.core import QgsProject
+from qgis.PyQt.QtCore import QSettings, QTimer, QTranslator, QCoreApplication
+from qgis.core import Qgis, QgsProject
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import QAction
 
@@ -10,11 +10,11 @@ from qgis.PyQt.QtWidgets import QAction
 from .resources import *
 # Import the code for the dialog
 from .qgis2wegue_dialog import qgis2wegueDialog
-from .wegueConf import WegueConfiguration
+from .wegue_export import WegueExport
 
-from .wegue_util import (center2webmercator,
+from .wegue_util import (describe_service_layer,
+                         prefetch_services,
                          scale2zoom,
-                         extract_wegue_layer_config,
                          rgb2hex
                          )
 
@@ -103,6 +103,10 @@ class qgis2wegue:
         # will be set False in run()
         self.first_start = True
 
+        # request capabilities of new layers in the background,
+        # so the export finds them already resolved
+        QgsProject.instance().layersAdded.connect(self.on_layers_added)
+
     def unload(self):
         """Removes the plugin menu item and icon from QGIS GUI."""
         for action in self.actions:
@@ -111,6 +115,22 @@ class qgis2wegue:
                 action)
             self.iface.removeToolBarIcon(action)
 
+        QgsProject.instance().layersAdded.disconnect(self.on_layers_added)
+
+    def on_layers_added(self, layers):
+        """Schedules background requests for newly added WMS/WFS layers"""
+
+        # runs while QGIS adds the layers, so only the cheap properties
+        # of service layers are read here
+        descriptors = [
+            descriptor for descriptor in map(describe_service_layer, layers)
+            if descriptor is not None]
+        if not descriptors:
+            return
+
+        # started from the event loop, so adding layers is not delayed
+        QTimer.singleShot(0, lambda: prefetch_services(descriptors))
+
     def run(self):
         """Run method that performs all the real work"""
 
@@ -127,8 +147,6 @@ class qgis2wegue:
     def final_task(self, result):
 
         if result:
-            # reset Wegue conf
-            self.wegue_conf = WegueConfiguration()
             self.store_wegue_conf_to_file()
 
     def check_path_and_handle_submit_button(self, path):
@@ -152,82 +170,88 @@ class qgis2wegue:
         """
 
         canvas = self.iface.mapCanvas()
-        qgis_instance = QgsProject.instance()
-
-        scale = canvas.scale()
-        center = canvas.center()
-
-        center_3857 = center2webmercator(center, qgis_instance)
-
-        zoom_level = scale2zoom(scale)
-
-        # add configuration from project
-        self.wegue_conf.mapZoom = zoom_level
-        self.wegue_conf.mapCenter = (center_3857.x(), center_3857.y())
-
-        # get information from all layers
-        # loop through checked layers
-        root = qgis_instance.layerTreeRoot()
-        for layer in root.checkedLayers():
-
-            result_layer = extract_wegue_layer_config(layer)
-            if result_layer:
-                self.wegue_conf.mapLayers.append(result_layer)
-
-        # add checkbox properties
-        self.wegue_conf.showCopyrightYear = \
-            self.dlg.q2w_copyright_year.isChecked()
-
-        if self.dlg.q2w_layer_list.isChecked():
-            self.wegue_conf.add_layer_list()
-
-        if self.dlg.q2w_info_click.isChecked():
-            self.wegue_conf.add_infoclick()
 
-        if self.dlg.q2w_help_window.isChecked():
-            self.wegue_conf.add_help_window()
+        zoom_level = scale2zoom(canvas.scale())
 
-        if self.dlg.q2w_measure_tool.isChecked():
-            self.wegue_conf.add_measuretool()
+        export = WegueExport(QgsProject.instance(), self.collect_options())
 
-        if self.dlg.q2w_max_extent.isChecked():
-            self.wegue_conf.add_button_zoom_to_extent()
-
-        if self.dlg.q2w_geocoder.isChecked():
-            self.wegue_conf.add_geocoder()
-
-        if self.dlg.q2w_geodata_drag_drop.isChecked():
-            self.wegue_conf.add_map_geodata_drag_drop()
-
-        if self.dlg.q2w_permalink.isChecked():
-            self.wegue_conf.add_permalink()
-
-        if self.dlg.q2w_geolocator.isChecked():
-            self.wegue_conf.add_geolocator()
-
-        if self.dlg.q2w_overview_map.isChecked():
-            self.wegue_conf.add_overview_map()
-
-        if self.dlg.q2w_view_animation.isChecked():
-            self.wegue_conf.add_view_animation()
-
-        if self.dlg.q2w_map_recorder.isChecked():
-            self.wegue_conf.add_maprecorder()
-
-        if self.dlg.q2w_attribute_table.isChecked():
-            self.wegue_conf.add_attribute_table()
+        # path for config
+        user_input = self.dlg.q2w_file_widget.filePath()
+        export.run(canvas.extent(), zoom_level, user_input)
+
+        self.report_validation_errors(export.errors)
+
+        if not export.written:
+            self.iface.messageBar().pushMessage(
+                "QGIS2Wegue",
+                self.tr(u"Configuration unchanged, file was not rewritten"),
+                level=Qgis.Info)
+
+    def collect_options(self):
+        """Converts the state of the form into export options"""
+
+        # checkboxes of the dialog and the respective module options
+        module_checkboxes = {
+            "layer_list": self.dlg.q2w_layer_list,
+            "infoclick": self.dlg.q2w_info_click,
+            "help_window": self.dlg.q2w_help_window,
+            "measuretool": self.dlg.q2w_measure_tool,
+            "zoom_to_extent": self.dlg.q2w_max_extent,
+            "geocoder": self.dlg.q2w_geocoder,
+            "geodata_drag_drop": self.dlg.q2w_geodata_drag_drop,
+            "permalink": self.dlg.q2w_permalink,
+            "geolocator": self.dlg.q2w_geolocator,
+            "overview_map": self.dlg.q2w_overview_map,
+            "view_animation": self.dlg.q2w_view_animation,
+            "maprecorder": self.dlg.q2w_map_recorder,
+            "attribute_table": self.dlg.q2w_attribute_table
+        }
 
         # color
         qt_color = self.dlg.q2w_color_widget.color()
         hex_color = rgb2hex(qt_color.red(), qt_color.green(), qt_color.blue())
-        self.wegue_conf.colorTheme = {
-            "themes": {
-                "light": {
-                    "primary": hex_color
-                }
+
+        return {
+            "modules": [name for name, checkbox in module_checkboxes.items()
+                        if checkbox.isChecked()],
+            "showCopyrightYear": self.dlg.q2w_copyright_year.isChecked(),
+            "color": hex_color,
+            "probe": self.dlg.q2w_probe_layers.isChecked(),
+            "budget": self.dlg.q2w_check_budget.isChecked(),
+            "profile_memory": self.dlg.q2w_profile_memory.isChecked(),
+            "legends": self.dlg.q2w_export_legends.isChecked(),
+            "publish": self.dlg.q2w_publish_files.isChecked() and {
+                "dir": "assets"
+            },
+            "seed": self.dlg.q2w_seed_manifest.isChecked() and {
+                "min_zoom": self.dlg.q2w_tiles_min_zoom.value(),
+                "max_zoom": self.dlg.q2w_tiles_max_zoom.value()
+            },
+            "export_vectors": self.dlg.q2w_export_vectors.isChecked() and {
+                "dir": "data"
+            },
+            "render_tiles": self.dlg.q2w_render_tiles.isChecked() and {
+                "min_zoom": self.dlg.q2w_tiles_min_zoom.value(),
+                "max_zoom": self.dlg.q2w_tiles_max_zoom.value()
             }
         }
 
-        # path for config
-        user_input = self.dlg.q2w_file_widget.filePath()
-        self.wegue_conf.to_file(user_input)
+    def report_validation_errors(self, errors):
+        """Shows schema errors of the configuration in the message bar"""
+
+        if not errors:
+            return
+
+        # only show the first errors, the rest goes to the log
+        max_shown = 5
+        details = "; ".join(
+            "{}: {}".format(path, message)
+            for path, message in errors[:max_shown])
+        if len(errors) > max_shown:
+            details += " (+{} more)".format(len(errors) - max_shown)
+
+        self.iface.messageBar().pushMessage(
+            "QGIS2Wegue",
+            self.tr(u"Configuration has {} schema error(s): {}").format(
+                len(errors), details),
+            level=Qgis.Warning)
@@ -0,0 +1,35 @@
+"""
+Test setup
+
+The plugin directory is a Python package that is imported by QGIS as
+``qgis2wegue``, independent of the name of the checkout. It is
+registered under that name here, so the modules and their relative
+imports work in the tests.
+"""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if "qgis2wegue" not in sys.modules:
+    _spec = importlib.util.spec_from_file_location(
+        "qgis2wegue", os.path.join(PLUGIN_DIR, "__init__.py"),
+        submodule_search_locations=[PLUGIN_DIR])
+    _module = importlib.util.module_from_spec(_spec)
+    sys.modules["qgis2wegue"] = _module
+    _spec.loader.exec_module(_module)
+
+
+@pytest.fixture(scope="session")
+def qgis_app():
+    """QGIS without GUI, needed for the network manager and event loop"""
+
+    qgis_core = pytest.importorskip("qgis.core")
+    app = qgis_core.QgsApplication([], False)
+    app.initQgis()
+    yield app
+    app.exitQgis()
@@ -0,0 +1,169 @@
+"""
+Incremental parsing of WMS and WFS capabilities documents
+"""
+
+import io
+
+import pytest
+
+from qgis2wegue.wegue_capabilities import (CapabilitiesParser,
+                                           parse_capabilities)
+
+WMS_111 = b"""<?xml version="1.0" encoding="UTF-8"?>
+<WMT_MS_Capabilities version="1.1.1"
+    xmlns:xlink="http://www.w3.org/1999/xlink">
+<Capability>
+<Request>
+<GetCapabilities><DCPType><HTTP><Get><OnlineResource
+    xlink:href="https://example.com/caps?"/></Get></HTTP></DCPType>
+</GetCapabilities>
+<GetMap><Format>image/png</Format><Format>image/jpeg</Format>
+<DCPType><HTTP><Get><OnlineResource
+    xlink:href="https://example.com/map?"/></Get></HTTP></DCPType>
+</GetMap>
+<GetLegendGraphic><Format>image/png</Format>
+<DCPType><HTTP><Get><OnlineResource
+    xlink:href="https://example.com/legend?"/></Get></HTTP></DCPType>
+</GetLegendGraphic>
+</Request>
+<Layer><Title>Root</Title>
+<LatLonBoundingBox minx="-180" miny="-90" maxx="180" maxy="90"/>
+<Layer><Name>roads</Name>
+<LatLonBoundingBox minx="5" miny="47" maxx="15" maxy="55"/>
+</Layer>
+<Layer><Name>rivers</Name></Layer>
+</Layer>
+</Capability>
+</WMT_MS_Capabilities>
+"""
+
+WMS_130 = b"""<?xml version="1.0" encoding="UTF-8"?>
+<WMS_Capabilities version="1.3.0" xmlns="http://www.opengis.net/wms"
+    xmlns:xlink="http://www.w3.org/1999/xlink">
+<Capability>
+<Request>
+<GetMap><Format>image/png</Format>
+<DCPType><HTTP><Get><OnlineResource
+    xlink:href="https://example.com/wms13?"/></Get></HTTP></DCPType>
+</GetMap>
+</Request>
+<Layer><Name>roads</Name>
+<EX_GeographicBoundingBox>
+<westBoundLongitude>5</westBoundLongitude>
+<eastBoundLongitude>15</eastBoundLongitude>
+<southBoundLatitude>47</southBoundLatitude>
+<northBoundLatitude>55</northBoundLatitude>
+</EX_GeographicBoundingBox>
+</Layer>
+</Capability>
+</WMS_Capabilities>
+"""
+
+WFS_100 = b"""<?xml version="1.0" encoding="UTF-8"?>
+<WFS_Capabilities version="1.0.0" xmlns="http://www.opengis.net/wfs">
+<Capability><Request>
+<GetFeature><DCPType><HTTP>
+<Get onlineResource="https://example.com/wfs10?"/>
+</HTTP></DCPType></GetFeature>
+</Request></Capability>
+<FeatureTypeList><FeatureType><Name>ns:trees</Name>
+<LatLonBoundingBox minx="1" miny="2" maxx="3" maxy="4"/>
+</FeatureType></FeatureTypeList>
+</WFS_Capabilities>
+"""
+
+WFS_200 = b"""<?xml version="1.0" encoding="UTF-8"?>
+<wfs:WFS_Capabilities version="2.0.0"
+    xmlns:wfs="http://www.opengis.net/wfs/2.0"
+    xmlns:ows="http://www.opengis.net/ows/1.1"
+    xmlns:xlink="http://www.w3.org/1999/xlink">
+<ows:OperationsMetadata>
+<ows:Operation name="GetCapabilities"><ows:DCP><ows:HTTP>
+<ows:Get xlink:href="https://example.com/caps?"/>
+</ows:HTTP></ows:DCP></ows:Operation>
+<ows:Operation name="GetFeature"><ows:DCP><ows:HTTP>
+<ows:Get xlink:href="https://example.com/wfs20?"/>
+</ows:HTTP></ows:DCP></ows:Operation>
+</ows:OperationsMetadata>
+<wfs:FeatureTypeList><wfs:FeatureType><wfs:Name>ns:trees</wfs:Name>
+<ows:WGS84BoundingBox>
+<ows:LowerCorner>1 2</ows:LowerCorner>
+<ows:UpperCorner>3 4</ows:UpperCorner>
+</ows:WGS84BoundingBox>
+</wfs:FeatureType></wfs:FeatureTypeList>
+</wfs:WFS_Capabilities>
+"""
+
+
+def test_wms_111():
+    result = parse_capabilities(
+        WMS_111, operations=("GetMap", "GetLegendGraphic"),
+        need_layers=True)
+
+    assert result["operations"] == {
+        "GetMap": "https://example.com/map?",
+        "GetLegendGraphic": "https://example.com/legend?"}
+    assert result["formats"] == ["image/png", "image/jpeg"]
+    # bboxes are inherited from the parent layer
+    assert result["layers"] == {
+        "roads": {"bbox": [5, 47, 15, 55]},
+        "rivers": {"bbox": [-180, -90, 180, 90]}}
+
+
+def test_wms_130_geographic_bounding_box():
+    result = parse_capabilities(WMS_130, layers=["roads"])
+
+    assert result["operations"] == {"GetMap": "https://example.com/wms13?"}
+    assert result["layers"] == {"roads": {"bbox": [5, 47, 15, 55]}}
+
+
+@pytest.mark.parametrize("document, url", [
+    (WFS_100, "https://example.com/wfs10?"),
+    (WFS_200, "https://example.com/wfs20?"),
+])
+def test_wfs(document, url):
+    result = parse_capabilities(document, operations=("GetFeature",),
+                                need_layers=True)
+
+    assert result["operations"] == {"GetFeature": url}
+    assert result["layers"] == {"ns:trees": {"bbox": [1, 2, 3, 4]}}
+
+
+def test_stops_after_the_operations():
+    result = parse_capabilities(WMS_111, chunk_size=16)
+
+    assert result["operations"] == {"GetMap": "https://example.com/map?"}
+    assert result["layers"] == {}
+
+
+def test_operation_not_offered():
+    result = parse_capabilities(
+        WMS_130, operations=("GetMap", "GetLegendGraphic"))
+
+    assert result["operations"] == {"GetMap": "https://example.com/wms13?"}
+
+
+def test_push_parser_stops_early():
+    parser = CapabilitiesParser(operations=("GetMap", "GetLegendGraphic"))
+    end_of_request = WMS_111.index(b"</Request>") + len(b"</Request>")
+
+    fed = 0
+    while not parser.feed(WMS_111[fed:fed + 7]):
+        fed += 7
+
+    assert fed < end_of_request + 7
+    assert parser.feed(b"ignored, not even XML <<<")
+    assert set(parser.close()["operations"]) == {"GetMap", "GetLegendGraphic"}
+
+
+def test_file_object():
+    result = parse_capabilities(io.BytesIO(WFS_200),
+                                operations=("GetFeature",), chunk_size=10)
+
+    assert result["operations"] == {"GetFeature": "https://example.com/wfs20?"}
+
+
+@pytest.mark.parametrize("document", [b"<Capabilities><Request>", b"no xml"])
+def test_invalid_document(document):
+    with pytest.raises(ValueError):
+        parse_capabilities(document)
@@ -0,0 +1,69 @@
+"""
+Configuration hashes and the diff between two exports
+"""
+
+from qgis2wegue.wegueConf import WegueConfiguration
+from qgis2wegue.wegueConfUtils import create_wms
+from qgis2wegue.wegue_hash import canonical_hash, conf_hashes, diff_hashes
+
+
+def _conf(*layers):
+    conf = WegueConfiguration()
+    conf.mapLayers.extend(layers)
+    conf.add_layer_list()
+    return conf
+
+
+def _roads(**props):
+    return create_wms("Roads", "https://example.com/wms?", "roads", **props)
+
+
+def _rivers():
+    return create_wms("Rivers", "https://example.com/wms?", "rivers")
+
+
+def test_canonical_hash_ignores_key_order():
+    assert canonical_hash({"a": 1, "b": [1, 2]}) == \
+        canonical_hash({"b": [1, 2], "a": 1})
+    assert canonical_hash(_roads()) == canonical_hash(_roads().to_dict())
+
+
+def test_unchanged_conf():
+    old = conf_hashes(_conf(_roads(), _rivers()))
+    new = conf_hashes(_conf(_roads(), _rivers()))
+
+    assert new == old
+    assert all(not keys for part in diff_hashes(old, new).values()
+               for keys in part.values())
+
+
+def test_diff_hashes():
+    old = conf_hashes(_conf(_roads(), _rivers()))
+    conf = _conf(_roads(visible=False))
+    conf.mapZoom = 5
+    conf.add_permalink()
+    del conf.modules["wgu-layerlist"]
+    new = conf_hashes(conf)
+
+    diff = diff_hashes(old, new)
+
+    assert new["hash"] != old["hash"]
+    assert diff["layers"] == {
+        "added": [], "removed": ["rivers"], "changed": ["roads"]}
+    assert diff["modules"] == {
+        "added": [], "removed": ["wgu-layerlist"], "changed": []}
+    assert diff["settings"] == {
+        "added": ["permalink"], "removed": [], "changed": ["mapZoom"]}
+
+
+def test_duplicate_layer_ids_are_kept_apart():
+    hashes = conf_hashes(_conf(_roads(), _rivers(), _roads(visible=False)))
+
+    assert list(hashes["layers"]) == ["roads", "rivers", "roads#2"]
+    assert hashes["layers"]["roads"] != hashes["layers"]["roads#2"]
+
+
+def test_diff_against_missing_hashes():
+    new = conf_hashes(_conf(_roads()))
+
+    assert diff_hashes({}, new)["layers"]["added"] == ["roads"]
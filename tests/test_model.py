@@ -0,0 +1,81 @@
+"""
+Typed configuration model and its JSON writer
+"""
+
+import io
+import json
+import pickle
+
+import pytest
+
+from qgis2wegue.wegueConf import WegueConfiguration
+from qgis2wegue.wegueConfUtils import (WegueLayer, create_wfs, create_wms,
+                                      wfs_loading_props)
+from qgis2wegue.wegue_convert import LayerDescriptor
+from qgis2wegue.wegue_model import write_json
+from qgis2wegue.wegue_tilemath import resolution_for_zoom
+
+
+def _conf():
+    conf = WegueConfiguration()
+    conf.mapCenter = (1234.5, -0.1)
+    conf.add_layer_list()
+    conf.add_permalink()
+    conf.mapLayers = [
+        create_wms("Straßen \"alt\"", "https://example.com/wms?", "a,b",
+                   visible=False, minResolution=0.5, maxResolution=1e21),
+        create_wfs("Bäume", "https://example.com/wfs", "ns:trees",
+                   geometryTypeName="Point", extent=[1, 2.5, 3, 4],
+                   loadOnlyVisible=True)]
+    return conf
+
+
+@pytest.mark.parametrize("value", [
+    {}, [], {"a": []}, "ä\n\t\\", -0.0, 1e-7, 10 ** 20,
+    [None, True, False, 0, 1.5, {"x": {"y": [1, [2]]}}],
+    float("inf"), float("nan")])
+def test_write_json_matches_json_dump(value):
+    out = io.StringIO()
+    write_json(value, out)
+    assert out.getvalue() == json.dumps(value, indent=2, ensure_ascii=False)
+
+
+def test_write_json_of_model_matches_json_dump():
+    conf = _conf()
+    out = io.StringIO()
+    write_json(conf, out)
+
+    assert out.getvalue() == json.dumps(
+        conf.to_dict(), indent=2, ensure_ascii=False)
+
+
+def test_unset_fields_are_left_out_in_slot_order():
+    layer = create_wms("Roads", "https://example.com/wms?", "roads")
+
+    assert list(layer) == ["type", "name", "url", "lid", "layers"]
+    assert "style" not in layer
+    assert layer.get("style", "none") == "none"
+    with pytest.raises(KeyError):
+        layer["style"]
+
+
+def test_unknown_layer_property():
+    with pytest.raises(TypeError):
+        WegueLayer("WMS", "Roads", "https://example.com/wms?", color="red")
+
+
+def test_descriptor_pickles():
+    descriptor = LayerDescriptor("WMS", "url=x", "Roads", extent=[0, 0, 1, 1])
+
+    assert pickle.loads(pickle.dumps(descriptor)).to_dict() == \
+        descriptor.to_dict()
+
+
+def test_wfs_loading_props():
+    assert wfs_loading_props(None) == {}
+    assert wfs_loading_props(5000) == {"loadOnlyVisible": False}
+    assert wfs_loading_props(5001) == {"loadOnlyVisible": True}
+    assert wfs_loading_props(50001) == {
+        "loadOnlyVisible": True, "maxResolution": resolution_for_zoom(11)}
+    assert wfs_loading_props(10, {"load_all_max": 5}) == {
+        "loadOnlyVisible": True}
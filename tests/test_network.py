@@ -0,0 +1,180 @@
+"""
+Timeouts, deadline and retries of wegue_network against a local server
+that answers slowly or with temporary errors
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("qgis")
+
+from qgis2wegue.wegue_network import NetworkSession  # noqa: E402
+
+LARGE_PIECE = 64 * 1024
+LARGE_SIZE = 128 * LARGE_PIECE
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    /sleep/<seconds>  answers after the given time
+    /unavailable      always answers 503
+    /large            answers 8 MB in pieces of 64 KB
+    """
+
+    def do_GET(self):
+        self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+
+        if self.path == "/large":
+            self.send_large()
+            return
+
+        if self.path.startswith("/sleep/"):
+            time.sleep(float(self.path.rsplit("/", 1)[1]))
+            status = 200
+        elif self.path == "/unavailable":
+            status = 503
+        else:
+            status = 404
+
+        body = b"ok"
+        try:
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up already
+            pass
+
+    def send_large(self):
+        piece = b"x" * LARGE_PIECE
+        try:
+            self.send_response(200)
+            self.send_header("Content-Length", str(LARGE_SIZE))
+            self.end_headers()
+            for _ in range(LARGE_SIZE // LARGE_PIECE):
+                self.wfile.write(piece)
+                self.wfile.flush()
+                time.sleep(0.005)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up already
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.hits = {}
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _url(server, path):
+    return "http://127.0.0.1:{}{}".format(server.server_address[1], path)
+
+
+def test_request_timeout(qgis_app, server):
+    session = NetworkSession(timeout=0.5, deadline=30, retries=0)
+
+    start = time.monotonic()
+    response = session.fetch_all([_url(server, "/sleep/3")])[0]
+    elapsed = time.monotonic() - start
+
+    assert not response.ok
+    assert response.error == "timed out"
+    assert response.attempts == 1
+    assert elapsed < 2
+
+
+def test_deadline_of_batch(qgis_app, server):
+    # every request alone is within its timeout, the batch is not
+    session = NetworkSession(timeout=30, deadline=1, retries=0)
+    urls = [_url(server, "/sleep/3?n={}".format(i)) for i in range(4)]
+
+    start = time.monotonic()
+    responses = session.fetch_all(urls)
+    elapsed = time.monotonic() - start
+
+    assert len(responses) == len(urls)
+    assert all(not response.ok for response in responses)
+    assert elapsed < 2.5
+
+
+def test_batch_runs_concurrently(qgis_app, server):
+    session = NetworkSession(timeout=5, deadline=10, retries=0)
+    urls = [_url(server, "/sleep/1?n={}".format(i)) for i in range(4)]
+
+    start = time.monotonic()
+    responses = session.fetch_all(urls)
+    elapsed = time.monotonic() - start
+
+    assert all(response.ok for response in responses)
+    assert elapsed < 3
+
+
+def test_retries_with_backoff(qgis_app, server):
+    session = NetworkSession(timeout=5, deadline=30, retries=2, backoff=0.3)
+
+    start = time.monotonic()
+    response = session.fetch_all([_url(server, "/unavailable")])[0]
+    elapsed = time.monotonic() - start
+
+    assert response.status == 503
+    assert response.attempts == 3
+    assert server.hits["/unavailable"] == 3
+    # pauses of 0.3 s and 0.6 s before the retries
+    assert elapsed >= 0.9
+
+
+def test_no_retry_after_deadline(qgis_app, server):
+    # the backoff pause would end after the deadline
+    session = NetworkSession(timeout=5, deadline=1, retries=5, backoff=2)
+
+    start = time.monotonic()
+    response = session.fetch_all([_url(server, "/unavailable")])[0]
+    elapsed = time.monotonic() - start
+
+    assert response.attempts == 1
+    assert server.hits["/unavailable"] == 1
+    assert elapsed < 1.5
+
+
+def test_streaming_stops_download(qgis_app, server):
+    session = NetworkSession(timeout=30, deadline=30, retries=0)
+    received = []
+
+    def on_data(data):
+        received.append(len(data))
+        return sum(received) >= LARGE_PIECE
+
+    response = session.fetch_all(
+        [("GET", _url(server, "/large"), None, on_data)])[0]
+
+    assert response.ok
+    assert response.streamed
+    assert response.content == b""
+    assert LARGE_PIECE <= sum(received) < LARGE_SIZE
+
+
+def test_streaming_consumer_error(qgis_app, server):
+    session = NetworkSession(timeout=30, deadline=30, retries=2)
+
+    def on_data(data):
+        raise ValueError("not a capabilities document")
+
+    response = session.fetch_all(
+        [("GET", _url(server, "/large"), None, on_data)])[0]
+
+    assert not response.ok
+    assert response.error == "not a capabilities document"
+    assert response.attempts == 1
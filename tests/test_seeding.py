@@ -0,0 +1,94 @@
+"""
+Request templates and tile URLs of the seeding manifest
+"""
+
+import json
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from qgis2wegue.wegueConfUtils import create_wms, create_xyz
+from qgis2wegue.wegue_seeding import (_expanded_rows,
+                                      seeding_template,
+                                      write_manifest,
+                                      zoom_levels)
+from qgis2wegue.wegue_tilemath import (ORIGIN_SHIFT, resolution_for_zoom,
+                                       tile_bounds)
+
+WMS_URL = "https://example.com/wms?MAP=roads"
+
+
+def _bbox(url):
+    return [float(v) for v in parse_qs(urlsplit(url).query)["BBOX"][0]
+            .split(",")]
+
+
+@pytest.mark.parametrize("zoom, min_x, min_y, max_x, max_y", [
+    (0, 0, 0, 0, 0),
+    (3, 0, 0, 7, 7),
+    (12, 2140, 1390, 2143, 1392),
+])
+def test_expanded_bbox_rows_match_tile_bounds(zoom, min_x, min_y,
+                                              max_x, max_y):
+    template = seeding_template(create_wms("Roads", WMS_URL, "roads"))
+
+    rows = list(_expanded_rows(template, zoom, min_x, min_y, max_x, max_y))
+
+    assert len(rows) == max_y - min_y + 1
+    for tile_y, row in zip(range(min_y, max_y + 1), rows):
+        assert len(row) == max_x - min_x + 1
+        for tile_x, url in zip(range(min_x, max_x + 1), row):
+            assert _bbox(url) == pytest.approx(
+                tile_bounds(zoom, tile_x, tile_y), abs=1e-6)
+
+
+def test_expanded_xyz_rows():
+    template = "https://tiles.example.com/{z}/{x}/{y}.png?y={-y}"
+
+    rows = list(_expanded_rows(template, 2, 1, 2, 2, 3))
+
+    assert rows == [
+        ["https://tiles.example.com/2/1/2.png?y=1",
+         "https://tiles.example.com/2/2/2.png?y=1"],
+        ["https://tiles.example.com/2/1/3.png?y=0",
+         "https://tiles.example.com/2/2/3.png?y=0"]]
+
+
+def test_wms_template():
+    template = seeding_template(create_wms("Roads", WMS_URL, "roads"))
+    query = parse_qs(urlsplit(template).query)
+
+    assert template.endswith("&BBOX={bbox}")
+    assert query["MAP"] == ["roads"]
+    assert query["LAYERS"] == ["roads"]
+    assert query["SRS"] == ["EPSG:3857"]
+
+
+@pytest.mark.parametrize("url", [
+    "tiles/{z}/{x}/{y}.png", "file:///data/tiles/{z}/{x}/{y}.png", ""])
+def test_local_layers_are_not_seeded(url):
+    assert seeding_template(create_xyz("Rendered", url)) is None
+
+
+def test_zoom_levels_follow_openlayers_visibility():
+    layer = create_xyz("OSM", "https://tiles.example.com/{z}/{x}/{y}.png",
+                       minResolution=resolution_for_zoom(10),
+                       maxResolution=resolution_for_zoom(4))
+
+    # visible for minResolution <= resolution < maxResolution
+    assert zoom_levels(layer, 0, 16) == [5, 6, 7, 8, 9, 10]
+
+
+def test_write_manifest(tmp_path):
+    layers = [
+        create_xyz("OSM", "https://tiles.example.com/{z}/{x}/{y}.png"),
+        create_xyz("Rendered", "tiles/{z}/{x}/{y}.png")]
+    extent = [-ORIGIN_SHIFT, -ORIGIN_SHIFT, ORIGIN_SHIFT, ORIGIN_SHIFT]
+    path = str(tmp_path / "app.seed.jsonl")
+
+    counts = write_manifest(layers, extent, path, 0, 1)
+
+    with open(path) as f:
+        lines = [json.loads(line) for line in f]
+    assert counts == {"osm": 1 + 4}
+    assert [(line["z"], line["count"]) for line in lines] == [(0, 1), (1, 4)]
@@ -0,0 +1,99 @@
+"""
+Schema validation of Wegue configurations, as model and as plain dicts
+"""
+
+from qgis2wegue.wegueConf import WegueConfiguration
+from qgis2wegue.wegueConfUtils import create_vector_layer, create_wms
+from qgis2wegue.wegue_validation import (compile_schema,
+                                         format_path,
+                                         validate_wegue_conf)
+
+
+def _conf(*layers):
+    conf = WegueConfiguration()
+    conf.mapLayers.extend(layers)
+    conf.add_layer_list()
+    return conf
+
+
+def _check(schema, value):
+    errors = []
+    compile_schema(schema)(value, None, errors)
+    return [(format_path(path), message) for path, message in errors]
+
+
+def test_valid_conf():
+    conf = _conf(
+        create_wms("Roads", "https://example.com/wms?", "roads"),
+        create_vector_layer("Trees", "data/trees.geojson", "GeoJSON"))
+
+    assert validate_wegue_conf(conf) == []
+    assert validate_wegue_conf(conf.to_dict()) == []
+
+
+def test_error_paths():
+    conf = _conf(
+        create_wms("Roads", "https://example.com/wms?", "roads"),
+        create_wms("Rivers", "", "rivers", lid="roads"))
+    conf.mapZoom = 30
+    conf.modules["wgu-layerlist"]["target"] = "sidebar"
+
+    errors = validate_wegue_conf(conf)
+
+    assert sorted(errors) == sorted([
+        ("mapZoom", "30 is greater than 28"),
+        ("mapLayers[1].lid", "duplicate value 'roads'"),
+        ("mapLayers[1].url", "must have at least 1 characters"),
+        ("modules.wgu-layerlist.target",
+         "'sidebar' is not one of ['menu', 'toolbar']"),
+    ])
+    assert sorted(validate_wegue_conf(conf.to_dict())) == sorted(errors)
+
+
+def test_discriminator_requires_type_specific_keys():
+    layer = create_vector_layer("Trees", "trees.kml", "KML").to_dict()
+    del layer["format"]
+    conf = _conf().to_dict()
+    conf["mapLayers"] = [layer]
+
+    assert validate_wegue_conf(conf) == [
+        ("mapLayers[0].format", "is required")]
+
+
+def test_type_errors():
+    schema = {"type": "object", "properties": {
+        "count": {"type": "integer"},
+        "ratio": {"type": "number"},
+        "tags": {"type": "array", "items": {"type": "string"}}}}
+
+    assert _check(schema, {"count": True, "ratio": "1", "tags": ["a", 1]}) \
+        == [("count", "expected integer, got bool"),
+            ("ratio", "expected number, got str"),
+            ("tags[1]", "expected string, got int")]
+    assert _check(schema, []) == [("<root>", "expected object, got list")]
+
+
+def test_required_and_additional_properties():
+    schema = {"type": "object", "required": ["a"],
+              "properties": {"a": {"type": "string"}},
+              "additionalProperties": False}
+
+    assert _check(schema, {"b": 1}) == [
+        ("a", "is required"), ("b", "is not allowed")]
+
+
+def test_additional_properties_schema():
+    schema = {"type": "object",
+              "additionalProperties": {"type": "object",
+                                       "required": ["target"]}}
+
+    assert _check(schema, {"x": {"target": "menu"}, "y": {}}) == [
+        ("y.target", "is required")]
+
+
+def test_array_length():
+    schema = {"type": "array", "minItems": 2, "maxItems": 2}
+
+    assert _check(schema, [1, 2]) == []
+    assert _check(schema, [1, 2, 3]) == [
+        ("<root>", "has 3 items, expected 2..2")]
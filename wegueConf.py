@@ -1,9 +1,22 @@
-import json
+from .wegue_hash import (conf_hashes,
+                         diff_hashes,
+                         file_unchanged,
+                         read_hashes,
+                         write_hashes)
+from .wegue_model import SlotsModel, write_json
+from .wegue_validation import validate_wegue_conf
 
 
-class WegueConfiguration:
+class WegueConfiguration(SlotsModel):
     """Contains parameters of a Wegue configuration"""
 
+    # order of the keys in the written JSON
+    # optional settings stay None until they are added
+    __slots__ = ("colorTheme", "logo", "logoSize", "showCopyrightYear",
+                 "mapZoom", "mapCenter", "mapLayers", "modules",
+                 "mapGeodataDragDop", "permalink", "overviewMap",
+                 "viewAnimation")
+
     def __init__(self):
         self.colorTheme = {
             "themes": {
@@ -19,12 +32,43 @@ class WegueConfiguration:
         self.mapCenter = (0, 0)
         self.mapLayers = []
         self.modules = {}
+        self.mapGeodataDragDop = self.permalink = self.overviewMap = \
+            self.viewAnimation = None
 
     def to_file(self, path):
         """Store Wegue configuration as JSON file"""
 
         with open(path, "w") as path:
-            json.dump(self.__dict__, path, indent=2, ensure_ascii=False)
+            write_json(self, path, indent=2)
+
+    def write_if_changed(self, path):
+        """
+        Stores the configuration only if its content differs from the
+        file written by the last export
+
+        Returns whether the file was written and a summary of the
+        added, removed and changed layers, modules and settings.
+        """
+
+        old_hashes = read_hashes(path)
+        new_hashes = conf_hashes(self)
+
+        written = not (old_hashes.get("hash") == new_hashes["hash"] and
+                       file_unchanged(path, old_hashes))
+        if written:
+            self.to_file(path)
+            write_hashes(path, new_hashes)
+
+        return written, diff_hashes(old_hashes, new_hashes)
+
+    def validate(self):
+        """
+        Checks the configuration against the Wegue schema
+
+        Returns a list of (path, message) tuples, empty if valid
+        """
+
+        return validate_wegue_conf(self)
 
     def add_map_geodata_drag_drop(self):
         self.mapGeodataDragDop = {
@@ -1,5 +1,45 @@
 import uuid
-from collections import OrderedDict
+
+from .wegue_model import SlotsModel
+from .wegue_tilemath import resolution_for_zoom
+
+# feature count thresholds for choosing the WFS loading strategy
+WFS_THRESHOLDS = {
+    # up to this number all features are loaded at once
+    "load_all_max": 5000,
+    # above this number the layer is only shown from min_zoom on
+    "min_zoom_above": 50000,
+    "min_zoom": 12
+}
+
+
+class WegueLayer(SlotsModel):
+    """
+    Wegue layer configuration
+
+    The order of the slots is the order of the keys in the written JSON.
+    Type, name, url and lid come first, so the config is easy to read.
+    """
+
+    __slots__ = ("type", "name", "url", "lid", "visible", "group",
+                 "format", "style",
+                 "layers", "typeName", "attributions", "extent",
+                 "loadOnlyVisible", "minResolution",
+                 "maxResolution", "legendUrl")
+
+    def __init__(self, wegue_layer_type, name, url, **props):
+        self.type = wegue_layer_type
+        self.name = name
+        self.url = url
+        self.lid = self.visible = self.group = self.format = self.style = \
+            self.layers = self.typeName = self.attributions = \
+            self.extent = self.loadOnlyVisible = self.minResolution = \
+            self.maxResolution = self.legendUrl = None
+        for key, value in props.items():
+            if key not in self._field_set:
+                raise TypeError(
+                    "unknown Wegue layer property '{}'".format(key))
+            setattr(self, key, value)
 
 
 def create_wms(name, url,
@@ -31,43 +71,47 @@ def create_wfs(name, url, typename, **wfs_props):
     return _make_layer_json("WFS", name, url, wfs_props)
 
 
-def _make_layer_json(wegue_layer_type, name, url, props):
-    """ Basic function for building a Wegue layer configuration"""
+def wfs_loading_props(feature_count, thresholds=None):
+    """
+    Chooses the loading strategy of a WFS layer from its number of
+    features and returns the respective layer properties
 
-    # convert to OrderedDict
-    # because we want to change the order of the properties
-    props = OrderedDict(props)
+    Small layers are loaded at once, larger ones per bounding box of
+    the visible extent (Wegue's loadOnlyVisible) and very large ones
+    only from a minimum zoom on. An unknown count (None) leaves the
+    Wegue defaults untouched.
+    """
 
-    # add basic properties
-    props['name'] = name
-    props['url'] = url
-    props["type"] = wegue_layer_type
+    if feature_count is None:
+        return {}
 
-    # lid needs to be created
-    if "lid" not in props:
-        props["lid"] = _create_layer_id(props["name"])
+    settings = dict(WFS_THRESHOLDS, **(thresholds or {}))
+
+    if feature_count <= settings["load_all_max"]:
+        return {"loadOnlyVisible": False}
+
+    props = {"loadOnlyVisible": True}
+    if feature_count > settings["min_zoom_above"]:
+        # OpenLayers hides a layer at maxResolution itself, the
+        # resolution of the previous zoom level keeps min_zoom visible
+        props["maxResolution"] = resolution_for_zoom(
+            settings["min_zoom"] - 1)
+    return props
+
+
+def _make_layer_json(wegue_layer_type, name, url, props):
+    """ Basic function for building a Wegue layer configuration"""
 
     # set style for vector layers
     if "geometryTypeName" in props:
         props["style"] = _assign_default_style(
-            props["geometryTypeName"])
-        del props["geometryTypeName"]
-
-    # move some keys to the beginning of the config
-    # makes sure that the user can read it easier
-    first_keys = ["type", "name", "url", "lid"]
-    if "format" in props:
-        first_keys.append("format")
-    for key in reversed(first_keys):
-        props.move_to_end(key)
-
-    # reverse order of dict
-    tmp = OrderedDict()
-    for key in reversed(props):
-        tmp[key] = props[key]
-    props = tmp
+            props.pop("geometryTypeName"))
 
-    return props
+    # lid needs to be created
+    if "lid" not in props:
+        props["lid"] = _create_layer_id(name)
+
+    return WegueLayer(wegue_layer_type, name, url, **props)
 
 
 def _create_layer_id(name):
@@ -98,7 +142,7 @@ def _create_layer_id(name):
 
     # in case all characters have been removed
     if lid == "":
-        lid = uuid.uuid1()
+        lid = str(uuid.uuid1())
 
     return lid
 
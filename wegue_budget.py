@@ -0,0 +1,184 @@
+"""
+Page weight estimate of an exported Wegue configuration
+
+Estimates what the Wegue app loads for its initial view: the
+configuration itself, vector files (sizes of local files via stat,
+of remote ones via concurrent HEAD requests) and the tiles of XYZ and
+WMS layers covering the viewport at mapZoom / mapCenter. Exceeding
+the budget is reported as export warnings.
+"""
+
+import os.path
+
+from .wegue_model import write_json
+from .wegue_network import NetworkSession
+from .wegue_tilemath import resolution_for_zoom, tile_range
+from .wegue_urls import local_path
+
+# limits of the initial view, all can be overridden by the options
+DEFAULT_BUDGET = {
+    # all bytes of the initial view including the configuration
+    "total_bytes": 5 * 1024 * 1024,
+    # bytes of a single layer
+    "layer_bytes": 2 * 1024 * 1024,
+    # number of requests of the initial view
+    "requests": 150,
+    # browser viewport in pixels
+    "viewport": [1280, 800],
+    # assumed average size of a tile by layer type
+    "tile_bytes": {"XYZ": 20 * 1024, "WMS": 30 * 1024}
+}
+
+
+class _ByteCounter:
+    """File object counting the UTF-8 bytes written to it"""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, text):
+        self.size += len(text.encode("utf-8"))
+
+
+def json_size(value):
+    """Returns the size of the JSON file write_json would write"""
+
+    counter = _ByteCounter()
+    write_json(value, counter)
+    return counter.size
+
+
+def viewport_extent(center, zoom, viewport):
+    """
+    Returns [minx, miny, maxx, maxy] in EPSG:3857 of a viewport of
+    [width, height] pixels around center at a zoom level
+    """
+
+    resolution = resolution_for_zoom(zoom)
+    half_width = viewport[0] * resolution / 2
+    half_height = viewport[1] * resolution / 2
+    return [center[0] - half_width, center[1] - half_height,
+            center[0] + half_width, center[1] + half_height]
+
+
+def _visible_at(layer, zoom):
+    """Whether OpenLayers shows a layer at the zoom level"""
+
+    # hidden layers are not loaded before they are switched on
+    if layer.get("visible") is False:
+        return False
+
+    resolution = resolution_for_zoom(zoom)
+    min_resolution = layer.get("minResolution")
+    max_resolution = layer.get("maxResolution")
+    if min_resolution is not None and resolution < min_resolution:
+        return False
+    if max_resolution is not None and resolution >= max_resolution:
+        return False
+    return True
+
+
+def _content_length(response):
+    if not response.ok:
+        return None
+    try:
+        return int(response.headers.get("content-length"))
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_page_weight(conf, conf_path, budget=None, timeout=10.0):
+    """
+    Estimates bytes and requests of the initial view of a configuration
+
+    Returns a dict with the size of the configuration, one entry per
+    layer and the totals. Layer bytes are None if unknown, e.g. for WFS
+    layers or remote files without a Content-Length.
+    """
+
+    budget = dict(DEFAULT_BUDGET, **(budget or {}))
+    zoom = int(round(conf.mapZoom or 0))
+    extent = viewport_extent(conf.mapCenter, zoom, budget["viewport"])
+    min_x, min_y, max_x, max_y = tile_range(extent, zoom)
+    tiles = (max_x - min_x + 1) * (max_y - min_y + 1)
+    base_dir = os.path.dirname(os.path.abspath(conf_path))
+
+    layers = []
+    head_requests = []
+    for layer in conf.mapLayers:
+        entry = {"lid": layer.lid, "type": layer.type, "bytes": None,
+                 "requests": 0, "source": None}
+        layers.append(entry)
+
+        if not _visible_at(layer, zoom):
+            entry["source"] = "hidden"
+
+        elif layer.type in budget["tile_bytes"]:
+            entry["requests"] = tiles
+            entry["bytes"] = tiles * budget["tile_bytes"][layer.type]
+            entry["source"] = "estimate"
+
+        elif layer.type == "VECTOR":
+            entry["requests"] = 1
+            path = local_path(layer.url, base_dir)
+            if path is None:
+                head_requests.append((entry, layer.url))
+            elif os.path.isfile(path):
+                entry["bytes"] = os.stat(path).st_size
+                entry["source"] = "stat"
+            else:
+                entry["source"] = "missing"
+
+        elif layer.type == "WFS":
+            # size depends on the features in view, only counted
+            entry["requests"] = 1
+
+    if head_requests:
+        session = NetworkSession(timeout=timeout, deadline=timeout + 5,
+                                 retries=0)
+        responses = session.fetch_all(
+            [("HEAD", url, None) for _, url in head_requests])
+        for (entry, _), response in zip(head_requests, responses):
+            entry["bytes"] = _content_length(response)
+            entry["source"] = "head"
+
+    config_bytes = json_size(conf)
+    return {
+        "zoom": zoom,
+        "viewport": budget["viewport"],
+        "tiles_per_layer": tiles,
+        "config_bytes": config_bytes,
+        "layers": layers,
+        "total_bytes": config_bytes + sum(
+            entry["bytes"] for entry in layers if entry["bytes"]),
+        "requests": 1 + sum(entry["requests"] for entry in layers)
+    }
+
+
+def check_budget(report, estimate, budget=None):
+    """Adds the estimate and warnings for budget overruns to a report"""
+
+    budget = dict(DEFAULT_BUDGET, **(budget or {}))
+    report.add_section("budget", estimate)
+
+    if estimate["total_bytes"] > budget["total_bytes"]:
+        report.add_warning(
+            "Initial view loads about {} bytes, budget is {}".format(
+                estimate["total_bytes"], budget["total_bytes"]))
+
+    if estimate["requests"] > budget["requests"]:
+        report.add_warning(
+            "Initial view sends about {} requests, budget is {}".format(
+                estimate["requests"], budget["requests"]))
+
+    for entry in estimate["layers"]:
+        if entry["bytes"] and entry["bytes"] > budget["layer_bytes"]:
+            report.add_warning(
+                "Layer '{}' loads about {} bytes, budget is {}".format(
+                    entry["lid"], entry["bytes"], budget["layer_bytes"]))
+        elif entry["source"] == "missing":
+            report.add_warning(
+                "File of layer '{}' not found".format(entry["lid"]))
+        elif entry["source"] == "head" and entry["bytes"] is None:
+            report.add_warning(
+                "Size of layer '{}' is unknown".format(entry["lid"]))
@@ -0,0 +1,270 @@
+"""
+Incremental parser for OGC capabilities documents (WMS, WFS, WMTS)
+
+Capabilities of large services, e.g. INSPIRE endpoints, can be tens of
+megabytes with thousands of layers. Instead of building the document
+tree, the parser is fed the document in chunks and only keeps the few
+values needed for the export. It stops as soon as everything asked for
+is found, for the GetMap URL usually within the first kilobytes.
+CapabilitiesParser takes the document piece by piece as it arrives
+from the network, so the download can be aborted at that point too.
+"""
+
+from xml.etree.ElementTree import ParseError, XMLParser
+
+CHUNK_SIZE = 64 * 1024
+
+_XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+
+# operations whose GET endpoint is extracted
+_OPERATIONS = ("GetMap", "GetFeature", "GetLegendGraphic", "GetTile")
+
+# elements whose text is needed
+_TEXT_ELEMENTS = frozenset((
+    "Name", "Format", "Identifier", "LowerCorner", "UpperCorner",
+    "westBoundLongitude", "southBoundLatitude",
+    "eastBoundLongitude", "northBoundLatitude"))
+
+_GEOGRAPHIC_BOUNDS = ("westBoundLongitude", "southBoundLatitude",
+                      "eastBoundLongitude", "northBoundLatitude")
+
+
+def _float_attributes(attrib, names):
+    try:
+        return [float(attrib[name]) for name in names]
+    except (KeyError, ValueError):
+        return None
+
+
+def _float_list(*values):
+    try:
+        return [float(v) for value in values for v in value.split()]
+    except (AttributeError, ValueError):
+        return None
+
+
+class _CapabilitiesTarget:
+    """Parser target collecting the wanted values"""
+
+    def __init__(self, wanted_layers):
+        self.wanted_layers = set(wanted_layers)
+        self.result = {
+            "operations": {},
+            "formats": [],
+            "layers": {},
+            "tile_matrix_sets": []
+        }
+        # local names of the open elements
+        self.path = []
+        # open Layer / FeatureType elements, bboxes are inherited
+        self.layer_stack = []
+        # name attribute of an open OWS Operation element
+        self.ows_operation = None
+        # whether the section listing the operations is closed,
+        # operations not found until then are not offered
+        self.operations_done = False
+        # text of the current element, None if not needed
+        self.text = None
+        # local names are cached, tags repeat all the time
+        self._names = {}
+
+    def _local_name(self, tag):
+        name = self._names.get(tag)
+        if name is None:
+            name = self._names[tag] = tag.rsplit("}", 1)[-1]
+        return name
+
+    def start(self, tag, attrib):
+        name = self._local_name(tag)
+        path = self.path
+        path.append(name)
+        self.text = [] if name in _TEXT_ELEMENTS else None
+
+        if name == "Layer" or name == "FeatureType":
+            bbox = self.layer_stack[-1]["bbox"] if self.layer_stack else None
+            self.layer_stack.append({"bbox": bbox})
+
+        elif name == "Operation":
+            self.ows_operation = attrib.get("name")
+
+        elif name == "OnlineResource":
+            # WMS: Request/GetMap/DCPType/HTTP/Get/OnlineResource
+            if len(path) >= 5 and path[-4] == "DCPType" and \
+                    path[-2] == "Get":
+                self._add_operation(path[-5], attrib.get(_XLINK_HREF))
+
+        elif name == "Get":
+            # WFS 1.0: Get element with an onlineResource attribute
+            # OWS (WFS 1.1/2.0, WMTS): Get element with xlink:href
+            href = attrib.get(_XLINK_HREF) or attrib.get("onlineResource")
+            if href and len(path) >= 4:
+                self._add_operation(self.ows_operation or path[-4], href)
+
+        elif name == "LatLonBoundingBox":
+            # WMS 1.1.1 and WFS 1.0
+            bbox = _float_attributes(attrib, ("minx", "miny", "maxx", "maxy"))
+            if bbox and self.layer_stack:
+                self.layer_stack[-1]["bbox"] = bbox
+
+    def data(self, data):
+        if self.text is not None:
+            self.text.append(data)
+
+    def end(self, tag):
+        path = self.path
+        name = path.pop()
+        text = "".join(self.text).strip() if self.text is not None else ""
+        self.text = None
+        parent = path[-1] if path else None
+
+        if name == "Layer" or name == "FeatureType":
+            layer = self.layer_stack.pop()
+            layer_name = layer.get("name")
+            if layer_name and (not self.wanted_layers or
+                               layer_name in self.wanted_layers):
+                self.result["layers"][layer_name] = {"bbox": layer["bbox"]}
+
+        elif name == "Name":
+            if (parent == "Layer" or parent == "FeatureType") and \
+                    self.layer_stack:
+                self.layer_stack[-1]["name"] = text
+
+        elif name == "Format":
+            if parent == "GetMap":
+                self.result["formats"].append(text)
+
+        elif name == "Identifier":
+            # WMTS: Contents/TileMatrixSet/Identifier
+            if parent == "TileMatrixSet" and len(path) >= 2 and \
+                    path[-2] == "Contents":
+                self.result["tile_matrix_sets"].append(text)
+
+        elif name in _GEOGRAPHIC_BOUNDS:
+            # WMS 1.3.0 EX_GeographicBoundingBox
+            if self.layer_stack:
+                layer = self.layer_stack[-1]
+                layer[name] = text
+                if all(bound in layer for bound in _GEOGRAPHIC_BOUNDS):
+                    layer["bbox"] = _float_list(*(
+                        layer.pop(bound) for bound in _GEOGRAPHIC_BOUNDS))
+
+        elif name == "LowerCorner" or name == "UpperCorner":
+            # WFS 1.1/2.0 and WMTS: WGS84BoundingBox
+            if parent == "WGS84BoundingBox" and self.layer_stack:
+                layer = self.layer_stack[-1]
+                layer[name] = text
+                if "LowerCorner" in layer and "UpperCorner" in layer:
+                    layer["bbox"] = _float_list(
+                        layer.pop("LowerCorner"), layer.pop("UpperCorner"))
+
+        elif name == "Operation":
+            self.ows_operation = None
+
+        elif name == "OperationsMetadata" or \
+                (name == "Request" and parent == "Capability"):
+            self.operations_done = True
+
+    def close(self):
+        return self.result
+
+    def _add_operation(self, operation, href):
+        if operation in _OPERATIONS and href and \
+                operation not in self.result["operations"]:
+            self.result["operations"][operation] = href
+
+    def done(self, operations, need_layers):
+        """Whether everything asked for is already found"""
+
+        found = self.result["operations"]
+        if not self.operations_done and \
+                any(operation not in found for operation in operations):
+            return False
+        if not need_layers:
+            return True
+        return bool(self.wanted_layers) and \
+            self.wanted_layers.issubset(self.result["layers"])
+
+
+class CapabilitiesParser:
+    """
+    Push parser for a capabilities document arriving in pieces
+
+    Arguments are the same as for parse_capabilities. feed() returns
+    True as soon as everything asked for is found, the rest of the
+    document is not needed then. close() returns the result.
+    Both raise ValueError for documents that are no valid XML.
+    """
+
+    def __init__(self, operations=("GetMap",), layers=(), need_layers=None):
+        if need_layers is None:
+            need_layers = bool(layers)
+        self.operations = operations
+        self.need_layers = need_layers
+        self.finished = False
+        self._target = _CapabilitiesTarget(layers)
+        self._parser = XMLParser(target=self._target)
+
+    def feed(self, data):
+        """Parses the next piece of the document, True when done"""
+
+        if not self.finished:
+            try:
+                self._parser.feed(data)
+            except ParseError as e:
+                raise ValueError(
+                    "Invalid capabilities document: {}".format(e))
+            self.finished = self._target.done(self.operations,
+                                              self.need_layers)
+        return self.finished
+
+    def close(self):
+        """Returns the result, see parse_capabilities"""
+
+        if self.finished:
+            return self._target.result
+        try:
+            return self._parser.close()
+        except ParseError as e:
+            raise ValueError("Invalid capabilities document: {}".format(e))
+
+
+def parse_capabilities(document, operations=("GetMap",), layers=(),
+                       need_layers=None, chunk_size=CHUNK_SIZE):
+    """
+    Extracts the needed parts of a capabilities document
+
+    document: bytes or a binary file object
+    operations: operations whose GET URL is required
+    layers: names of the layers / feature types to collect, all if empty
+    need_layers: keep parsing until the layers are found, defaults to
+        True if layers are given
+
+    Returns a dict:
+
+        {
+            "operations": {"GetMap": url, ...},
+            "formats": [GetMap output formats],
+            "layers": {name: {"bbox": [minx, miny, maxx, maxy] (WGS84)}},
+            "tile_matrix_sets": [identifiers]
+        }
+
+    Parsing stops as soon as the operations and layers are found, so
+    values following them in the document may be missing. Operations
+    the service doesn't offer are missing from "operations", looking
+    for them stops at the end of the operations section.
+    Raises ValueError for documents that are no valid XML.
+    """
+
+    parser = CapabilitiesParser(operations, layers, need_layers)
+
+    if isinstance(document, (bytes, bytearray)):
+        view = memoryview(document)
+        chunks = (view[i:i + chunk_size]
+                  for i in range(0, len(view), chunk_size))
+    else:
+        chunks = iter(lambda: document.read(chunk_size), b"")
+
+    for chunk in chunks:
+        if parser.feed(chunk):
+            break
+    return parser.close()
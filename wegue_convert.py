@@ -0,0 +1,300 @@
+"""
+Conversion of layer descriptors into Wegue layer configurations
+
+This module does not import QGIS. A LayerDescriptor holds the plain data
+of a QGIS layer, it is extracted on the QGIS side (see
+wegue_util.describe_layer). Everything a conversion needs from the
+network is resolved beforehand and passed in as ``services``:
+
+    {
+        "get_map_urls": {(capabilities URL, authcfg): GetMap URL or None},
+        "feature_counts": {(WFS URL, type name, authcfg): count or None}
+    }
+
+Services are keyed by their authentication configuration (authcfg)
+too, a service may answer differently depending on the credentials.
+
+Descriptors, services and results can be pickled, so the conversion
+also runs in multiprocessing workers.
+"""
+
+from urllib.parse import parse_qs
+
+from .wegueConfUtils import (create_vector_layer,
+                             create_wfs,
+                             create_wms,
+                             create_xyz,
+                             wfs_loading_props)
+from .wegue_model import SlotsModel
+from .wegue_urls import build_url
+
+# size of a pixel in meters as defined by OGC
+_PIXEL_SIZE = 0.00028
+
+
+class LayerDescriptor(SlotsModel):
+    """
+    Plain data of a QGIS layer needed for the conversion
+
+    geometry_type: "Point", "LineString", "Polygon" or "" for rasters
+    extent: [minx, miny, maxx, maxy] in the CRS of the layer
+    min_scale / max_scale: scale based visibility or None
+    visible: whether the layer is checked in the layer tree
+    group: path of the layer tree group, e.g. "Base/Roads", or None
+    """
+
+    __slots__ = ("provider_type", "source", "name", "geometry_type",
+                 "extent", "min_scale", "max_scale", "visible", "group")
+
+    def __init__(self, provider_type, source, name, geometry_type="",
+                 extent=None, min_scale=None, max_scale=None,
+                 visible=True, group=None):
+        self.provider_type = provider_type.lower()
+        self.source = source
+        self.name = name
+        self.geometry_type = geometry_type
+        self.extent = extent
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.visible = visible
+        self.group = group
+
+
+def get_wfs_properties(source):
+    """Extracts the WFS properties from the layer source"""
+
+    # manually converting source into dict
+    source = source.strip()
+    items = source.split(" ")
+
+    # built property dict
+    props = {}
+    for i in items:
+        # extract keys and values
+        spl = i.split("=", 1)
+        k, v = spl[0], spl[1]
+
+        # remove single quote
+        v = v.replace("'", "")
+
+        # handle keys that appear
+        props[k] = v
+    return props
+
+
+def wms_capabilities_url(url):
+    """Returns the GetCapabilities request of a WMS"""
+
+    return build_url(url, {
+        "SERVICE": "WMS",
+        "REQUEST": "GetCapabilities",
+        "VERSION": "1.1.1"
+    })
+
+
+def wfs_hits_url(props):
+    """Returns the URL of a resultType=hits request for a WFS source"""
+
+    version = props.get("version", "1.1.0")
+    if version == "auto":
+        version = "1.1.0"
+    typename_key = "TYPENAMES" if version.startswith("2") else "TYPENAME"
+    return build_url(props["url"], {
+        "SERVICE": "WFS",
+        "VERSION": version,
+        "REQUEST": "GetFeature",
+        typename_key: props["typename"],
+        "RESULTTYPE": "hits"
+    })
+
+
+def _wms_source(descriptor):
+    """
+    Returns the parsed source of a WMS provider layer
+    and whether it is a plain WMS (not XYZ or WMTS)
+    """
+
+    layer_props = parse_qs(descriptor.source)
+    plain_wms = not (
+        ("type" in layer_props and layer_props["type"][0] == "xyz") or
+        "tileMatrixSet" in layer_props)
+    return layer_props, plain_wms
+
+
+def _wms_key(layer_props):
+    return layer_props["url"][0], layer_props.get("authcfg", [None])[0]
+
+
+def _wfs_key(props):
+    return props["url"], props["typename"], props.get("authcfg")
+
+
+def required_services(descriptors):
+    """
+    Lists what has to be requested before the conversion
+
+    Returns two dicts:
+    (WMS capabilities URL, authcfg) -> authcfg
+    (WFS URL, type name, authcfg) -> WFS source properties
+    """
+
+    wms = {}
+    wfs = {}
+    for descriptor in descriptors:
+        if descriptor.provider_type == "wms":
+            layer_props, plain_wms = _wms_source(descriptor)
+            if plain_wms:
+                key = _wms_key(layer_props)
+                wms[key] = key[1]
+        elif descriptor.provider_type == "wfs":
+            props = get_wfs_properties(descriptor.source)
+            wfs[_wfs_key(props)] = props
+    return wms, wfs
+
+
+def _scale_props(descriptor):
+    """Converts scale based visibility into OpenLayers resolutions"""
+
+    props = {}
+    if descriptor.min_scale:
+        props["maxResolution"] = descriptor.min_scale * _PIXEL_SIZE
+    if descriptor.max_scale:
+        props["minResolution"] = descriptor.max_scale * _PIXEL_SIZE
+    return props
+
+
+def convert_layer(descriptor, services=None, wfs_thresholds=None):
+    """
+    Converts a layer descriptor to a Wegue layer configuration
+
+    Returns None if the layer type is not supported or a required
+    service could not be resolved.
+    """
+
+    wegue_layer = _convert_source(descriptor, services, wfs_thresholds)
+    if wegue_layer is not None:
+        apply_tree_props(wegue_layer, descriptor)
+    return wegue_layer
+
+
+def apply_tree_props(wegue_layer, descriptor):
+    """
+    Takes over the layer tree state: unchecked layers are exported as
+    hidden, so Wegue loads them only once they are switched on
+    """
+
+    wegue_layer.visible = bool(descriptor.visible)
+    wegue_layer.group = descriptor.group or None
+
+
+def _convert_source(descriptor, services, wfs_thresholds):
+    """Creates the Wegue layer matching the provider and source"""
+
+    services = services or {}
+    providerType = descriptor.provider_type
+    source = descriptor.source
+
+    # same for all types
+    name = descriptor.name
+    scale_props = _scale_props(descriptor)
+
+    if providerType == "wms":
+        # Raster layer distinction proudly taken from the great qgis2web
+        # project. All credits to the qgis2web devs
+        # https://github.com/tomchadwin/qgis2web
+        layer_props, plain_wms = _wms_source(descriptor)
+
+        # XYZ
+        if "type" in layer_props and layer_props["type"][0] == "xyz":
+            url = layer_props["url"][0]
+
+            # in case no attribution is available
+            attributions = ""
+            if "referer" in layer_props:
+                attributions = layer_props["referer"][0]
+
+            return create_xyz(
+                name, url, attributions=attributions, **scale_props)
+
+        # WMTS - currently not supported in Wegue
+        elif not plain_wms:
+            pass
+
+        # WMS
+        else:
+            layers_wms_property = layer_props['layers'][0]
+
+            # getMap URL resolved from the capabilities
+            url_get_map = services.get("get_map_urls", {}).get(
+                _wms_key(layer_props))
+            if url_get_map is None:
+                return None
+
+            return create_wms(name, url_get_map, layers_wms_property,
+                              **scale_props)
+
+    # KML or GeoJSON
+    elif providerType == "ogr":
+
+        url = source.split("|")[0]
+
+        if(url.endswith(".kml") |
+                url.endswith(".json") |
+                url.endswith(".geojson")):
+
+            formatMapping = "GeoJSON"
+            if url.endswith(".kml"):
+                formatMapping = "KML"
+
+            return create_vector_layer(
+                name, url, formatMapping,
+                geometryTypeName=descriptor.geometry_type,
+                **scale_props)
+
+    # WFS
+    elif providerType == "wfs":
+
+        props = get_wfs_properties(source)
+
+        typename = props["typename"]
+        url = props["url"]
+
+        # loading strategy based on the number of features
+        feature_count = services.get("feature_counts", {}).get(
+            _wfs_key(props))
+        loading_props = wfs_loading_props(feature_count, wfs_thresholds)
+
+        # the stricter limit wins if both set a maximum resolution
+        if "maxResolution" in scale_props and \
+                "maxResolution" in loading_props:
+            loading_props["maxResolution"] = min(
+                loading_props["maxResolution"],
+                scale_props.pop("maxResolution"))
+        loading_props.update(scale_props)
+
+        return create_wfs(
+            name, url, typename,
+            geometryTypeName=descriptor.geometry_type,
+            extent=descriptor.extent,
+            **loading_props)
+
+    # Provider Type not supported
+    return None
+
+
+def convert_layers(descriptors, services=None, wfs_thresholds=None,
+                   pool=None):
+    """
+    Converts several descriptors, optionally in a multiprocessing pool
+
+    Returns a list with a Wegue layer or None for every descriptor.
+    """
+
+    if pool is None:
+        return [convert_layer(descriptor, services, wfs_thresholds)
+                for descriptor in descriptors]
+
+    return pool.starmap(
+        convert_layer,
+        [(descriptor, services, wfs_thresholds)
+         for descriptor in descriptors])
@@ -0,0 +1,530 @@
+"""
+Export of a QGIS project to a Wegue configuration
+
+Used by the plugin dialog as well as by the headless worker. All
+settings of an export are passed as a plain options dict:
+
+    {
+        "modules": ["layer_list", "infoclick", ...],
+        "showCopyrightYear": true,
+        "color": "#cc0000",
+        "probe": false,
+        "export_vectors": {"dir": "data", "url": "data", "precision": 2},
+        "render_tiles": {"min_zoom": 0, "max_zoom": 16, "max_tiles": 100000,
+                         "remote": false},
+        "wfs_thresholds": {"load_all_max": 5000, "min_zoom_above": 50000},
+        "budget": {"total_bytes": 5242880, "requests": 150},
+        "profile_memory": {"top": 10},
+        "seed": {"min_zoom": 0, "max_zoom": 16, "expand": false},
+        "publish": {"dir": "assets", "url": "assets", "link": false},
+        "legends": {"dir": "legends", "url": "legends", "sprite": false}
+    }
+
+"budget", "profile_memory", "seed" and "legends" may also be true to
+use the defaults (see wegue_budget.DEFAULT_BUDGET, wegue_memory.TOP_SITES and
+wegue_seeding).
+"""
+
+import os.path
+import time
+from collections import OrderedDict
+
+from .wegueConf import WegueConfiguration
+from .wegueConfUtils import create_xyz
+from .wegue_budget import check_budget, estimate_page_weight
+from .wegue_memory import TOP_SITES, MemoryProfiler
+from .wegue_probe import annotate_report, probe_layers
+from .wegue_publish import (AssetPublisher,
+                            publish_cache_path_for,
+                            publish_layers)
+from .wegue_report import ExportReport, report_path_for
+from .wegue_seeding import (DEFAULT_MAX_ZOOM,
+                            DEFAULT_MIN_ZOOM,
+                            manifest_path_for,
+                            write_manifest)
+from .wegue_tiles import (REMOTE_PROVIDERS,
+                          TileRenderer,
+                          count_tiles,
+                          intersect_extents,
+                          layer_extent_3857)
+from .wegue_convert import (LayerDescriptor,
+                            apply_tree_props,
+                            convert_layer,
+                            convert_layers)
+from .wegue_geojson import VECTOR_PROVIDERS, GeoJsonExportTask, export_geojson
+from .wegue_legend import LegendExport
+from .wegue_util import (center2webmercator,
+                         describe_layer,
+                         extent2webmercator,
+                         layer_group,
+                         legend_endpoints,
+                         resolve_services)
+
+# seeding manifests with more tiles are reported as warnings
+MAX_SEED_TILES = 1000000
+
+# tiles are only rendered up to this number, rendering is synchronous
+MAX_RENDER_TILES = 100000
+
+# module options and the methods adding them to the configuration
+MODULE_OPTIONS = OrderedDict([
+    ("layer_list", WegueConfiguration.add_layer_list),
+    ("infoclick", WegueConfiguration.add_infoclick),
+    ("help_window", WegueConfiguration.add_help_window),
+    ("measuretool", WegueConfiguration.add_measuretool),
+    ("zoom_to_extent", WegueConfiguration.add_button_zoom_to_extent),
+    ("geocoder", WegueConfiguration.add_geocoder),
+    ("geodata_drag_drop", WegueConfiguration.add_map_geodata_drag_drop),
+    ("permalink", WegueConfiguration.add_permalink),
+    ("geolocator", WegueConfiguration.add_geolocator),
+    ("overview_map", WegueConfiguration.add_overview_map),
+    ("view_animation", WegueConfiguration.add_view_animation),
+    ("maprecorder", WegueConfiguration.add_maprecorder),
+    ("attribute_table", WegueConfiguration.add_attribute_table)
+])
+
+
+class WegueExport:
+    """
+    A single export of a QGIS project
+
+    Collects the configuration, the export report, schema errors
+    and the time spent in every phase.
+    """
+
+    def __init__(self, qgis_instance, options):
+        self.qgis_instance = qgis_instance
+        self.options = options
+        self.wegue_conf = WegueConfiguration()
+        self.report = ExportReport()
+        self.errors = []
+        self.timings = OrderedDict()
+
+        # whether the configuration file was (re)written
+        self.written = False
+
+        # tracemalloc statistics of every phase, only if requested
+        self.profiler = None
+        profile_options = options.get("profile_memory")
+        if profile_options:
+            if not isinstance(profile_options, dict):
+                profile_options = {}
+            self.profiler = MemoryProfiler(
+                profile_options.get("top", TOP_SITES))
+
+        # layers Wegue can't load directly: (position in the layer list,
+        # QGIS layer, descriptor), later export phases might convert them
+        self.unsupported_layers = []
+
+        # (Wegue layer, QGIS layer) of the exported layers by QGIS layer
+        # id, lids are derived from names and may repeat
+        self.qgis_layers = {}
+
+    def run(self, extent, zoom_level, path):
+        """
+        Creates the configuration for the given map extent
+        (in project CRS) and zoom level and stores it at path
+        """
+
+        if self.profiler is not None:
+            self.profiler.start()
+        try:
+            self._run_phases(extent, zoom_level, path)
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
+
+        if self.profiler is not None:
+            self.profiler.to_report(self.report)
+
+        if not self.report.is_empty():
+            self.report.to_file(report_path_for(path))
+
+    def _run_phases(self, extent, zoom_level, path):
+        self._phase("layers", self.add_layers)
+
+        if self.options.get("export_vectors"):
+            self._phase("vectors", self.export_vectors, path)
+
+        if self.options.get("render_tiles"):
+            self._phase("tiles", self.render_tiles, extent, zoom_level, path)
+
+        # layers nobody could convert are left out
+        self.wegue_conf.mapLayers = [
+            result_layer for result_layer in self.wegue_conf.mapLayers
+            if result_layer is not None]
+
+        if self.options.get("publish"):
+            self._phase("publish", self.publish_files, path)
+
+        if self.options.get("legends"):
+            self._phase("legends", self.export_legends, path)
+
+        self._phase("settings", self.add_settings,
+                    extent.center(), zoom_level)
+
+        if self.options.get("probe"):
+            self._phase("probe", self.probe, extent, zoom_level)
+
+        if self.options.get("seed"):
+            self._phase("seed", self.write_seeding_manifest, extent, path)
+
+        if self.options.get("budget"):
+            self._phase("budget", self.estimate_budget, path)
+
+        self._phase("validate", self.validate)
+        self._phase("write", self.write, path)
+
+    def _phase(self, name, func, *args):
+        if self.profiler is not None:
+            self.profiler.phase_started()
+
+        start = time.perf_counter()
+        func(*args)
+        self.timings[name] = round(time.perf_counter() - start, 4)
+
+        if self.profiler is not None:
+            self.profiler.phase_finished(name)
+
+    def add_layers(self):
+        """
+        Converts all layers of the project in layer tree order
+
+        Unchecked layers are exported as hidden layers, so they are
+        available in Wegue without being loaded at startup.
+        """
+
+        root = self.qgis_instance.layerTreeRoot()
+        nodes = [node for node in root.findLayers()
+                 if node.layer() is not None]
+        layers = [node.layer() for node in nodes]
+
+        # one pass over the QGIS layers, then everything needed from
+        # the network in one concurrent batch
+        descriptors = [
+            describe_layer(node.layer(), node.isVisible(), layer_group(node))
+            for node in nodes]
+        services = resolve_services(descriptors)
+
+        result_layers = convert_layers(
+            descriptors, services, self.options.get("wfs_thresholds"))
+
+        for layer, descriptor, result_layer in zip(
+                layers, descriptors, result_layers):
+            if result_layer is None:
+                # placeholder, later export phases might replace it
+                self.unsupported_layers.append(
+                    (len(self.wegue_conf.mapLayers), layer, descriptor))
+            else:
+                self.qgis_layers[layer.id()] = (result_layer, layer)
+            self.wegue_conf.mapLayers.append(result_layer)
+
+    def _replace_placeholders(self, replacements):
+        """
+        Puts layers created for unsupported layers at their position in
+        the layer list and removes them from the unsupported ones
+        """
+
+        unsupported = {
+            index: (layer, descriptor)
+            for index, layer, descriptor in self.unsupported_layers}
+
+        handled = set()
+        for index, result_layer in replacements:
+            layer, descriptor = unsupported[index]
+            apply_tree_props(result_layer, descriptor)
+            self.wegue_conf.mapLayers[index] = result_layer
+            self.qgis_layers[layer.id()] = (result_layer, layer)
+            handled.add(index)
+
+        self.unsupported_layers = [
+            item for item in self.unsupported_layers
+            if item[0] not in handled]
+
+    def export_vectors(self, path):
+        """
+        Writes unsupported vector layers (GeoPackage, Shapefile, ...)
+        as GeoJSON next to the configuration and adds them as layers
+        """
+
+        vector_options = self.options["export_vectors"]
+        data_dir = vector_options.get("dir", "data")
+        data_url = vector_options.get("url", data_dir)
+        precision = vector_options.get("precision", 2)
+
+        base_dir = os.path.join(os.path.dirname(path), data_dir)
+
+        tasks = []
+        replacements = []
+        for index, layer, descriptor in self.unsupported_layers:
+            if (descriptor.provider_type not in VECTOR_PROVIDERS or
+                    not descriptor.geometry_type):
+                continue
+
+            file_name = layer.id() + ".geojson"
+            tasks.append(GeoJsonExportTask(
+                layer, os.path.join(base_dir, file_name),
+                self.qgis_instance, precision))
+
+            # converted like any other GeoJSON file, the extent is
+            # left out because it is in the CRS of the source
+            web_descriptor = LayerDescriptor(
+                "ogr", data_url + "/" + file_name, descriptor.name,
+                descriptor.geometry_type, None,
+                descriptor.min_scale, descriptor.max_scale)
+            replacements.append((index, convert_layer(web_descriptor)))
+
+        finished = export_geojson(tasks)
+
+        # layers whose export failed stay unsupported
+        exported = []
+        for replacement, task in zip(replacements, finished):
+            if task.error is None:
+                exported.append((replacement, task))
+            else:
+                self.report.add_warning(
+                    "Layer '{}' could not be exported as GeoJSON: {}".format(
+                        replacement[1].name, task.error))
+        self._replace_placeholders(
+            [replacement for replacement, _ in exported])
+
+        self.report.add_section("vectors", [
+            {"lid": result_layer.lid, "path": task.path,
+             "features": task.features}
+            for (_, result_layer), task in exported])
+
+    def render_tiles(self, extent, zoom_level, path):
+        """
+        Renders unsupported layers into XYZ tiles next to the
+        configuration and adds them as XYZ layers
+
+        Layers of remote services (see wegue_tiles.REMOTE_PROVIDERS),
+        e.g. a WMS whose capabilities failed or a WMTS, are only
+        rendered with the option "remote", their tiles would be pulled
+        from the service and hosted again.
+        """
+
+        tile_options = self.options["render_tiles"]
+        min_zoom = tile_options.get("min_zoom", 0)
+        max_zoom = tile_options.get("max_zoom", min(zoom_level + 4, 18))
+        max_tiles = tile_options.get("max_tiles", MAX_RENDER_TILES)
+        tile_dir = tile_options.get("dir", "tiles")
+        tile_url = tile_options.get("url", tile_dir)
+
+        if min_zoom > max_zoom:
+            self.report.add_warning(
+                "No tiles rendered: min zoom {} is above max zoom {}".format(
+                    min_zoom, max_zoom))
+            return
+
+        extent_3857 = extent2webmercator(extent, self.qgis_instance)
+        base_dir = os.path.join(os.path.dirname(path), tile_dir)
+
+        tasks = []
+        replacements = []
+        for index, layer, descriptor in self.unsupported_layers:
+            if not layer.isSpatial():
+                continue
+            if descriptor.provider_type in REMOTE_PROVIDERS and \
+                    not tile_options.get("remote", False):
+                continue
+            layer_extent = intersect_extents(
+                extent_3857, layer_extent_3857(layer, self.qgis_instance))
+            if layer_extent is None:
+                continue
+
+            # named by layer id like exported vectors, lids are derived
+            # from names which may repeat or not be valid in URLs
+            result_layer = create_xyz(layer.name(), None)
+            result_layer.url = "{}/{}/{{z}}/{{x}}/{{y}}.png".format(
+                tile_url, layer.id())
+            tasks.append((layer, os.path.join(base_dir, layer.id()),
+                          layer_extent))
+            replacements.append((index, result_layer))
+
+        total = count_tiles(
+            [layer_extent for _, _, layer_extent in tasks],
+            min_zoom, max_zoom)
+        if total > max_tiles:
+            self.report.add_warning(
+                "No tiles rendered: {} tiles for zoom {} to {}, more than "
+                "{}; reduce the zoom range or the extent".format(
+                    total, min_zoom, max_zoom, max_tiles))
+            return
+
+        renderer = TileRenderer(self.qgis_instance)
+        renderer.render(tasks, min_zoom, max_zoom)
+
+        self._replace_placeholders(replacements)
+
+        self.report.add_section("tiles", {
+            "layers": [result_layer.lid for _, result_layer in replacements],
+            "rendered": renderer.rendered,
+            "skipped": renderer.skipped,
+            "failed": renderer.failed
+        })
+        if renderer.failed:
+            self.report.add_warning(
+                "{} tile(s) could not be written".format(renderer.failed))
+
+    def publish_files(self, path):
+        """
+        Places local vector files under content-hashed names in an
+        asset directory next to the configuration and points the
+        layers to them
+        """
+
+        publish_options = self.options["publish"]
+        asset_dir = publish_options.get("dir", "assets")
+        asset_url = publish_options.get("url", asset_dir)
+
+        base_dir = os.path.dirname(os.path.abspath(path))
+        publisher = AssetPublisher(
+            os.path.join(base_dir, asset_dir), asset_url,
+            publish_cache_path_for(path), publish_options.get("link", False))
+        results = publish_layers(
+            self.wegue_conf.mapLayers, base_dir, publisher)
+
+        self.report.add_section("publish", {
+            "layers": [
+                {"lid": layer.lid, "source": source, "url": layer.url}
+                for layer, source, error in results if error is None],
+            "hashed": publisher.hashed,
+            "linked": publisher.linked,
+            "copied": publisher.copied,
+            "existing": publisher.existing
+        })
+        for layer, source, error in results:
+            if error is not None:
+                self.report.add_warning(
+                    "Could not publish '{}' of layer '{}': {}".format(
+                        source, layer.lid, error))
+
+    def export_legends(self, path):
+        """
+        Writes static legend images next to the configuration and
+        references them from the layers, see wegue_legend
+        """
+
+        legend_options = self.options["legends"]
+        if not isinstance(legend_options, dict):
+            legend_options = {}
+        legend_dir = legend_options.get("dir", "legends")
+        legend_url = legend_options.get("url", legend_dir)
+
+        legends = LegendExport(
+            os.path.join(os.path.dirname(path), legend_dir), legend_url,
+            legend_endpoints())
+        items = list(self.qgis_layers.values())
+        legends.export(items)
+        legends.apply(items)
+
+        sprite = None
+        if legend_options.get("sprite"):
+            sprite = legends.write_sprite()
+
+        self.report.add_section("legends", {
+            "fetched": legends.fetched,
+            "cached": legends.cached,
+            "rendered": legends.rendered,
+            "sprite": sprite
+        })
+        for lid, message in legends.failed:
+            self.report.add_warning(
+                "No legend for layer '{}': {}".format(lid, message))
+
+    def add_settings(self, center, zoom_level):
+        """Adds map view, modules and theme"""
+
+        center_3857 = center2webmercator(center, self.qgis_instance)
+
+        self.wegue_conf.mapZoom = zoom_level
+        self.wegue_conf.mapCenter = (center_3857.x(), center_3857.y())
+
+        self.wegue_conf.showCopyrightYear = bool(
+            self.options.get("showCopyrightYear", True))
+
+        modules = self.options.get("modules", [])
+        for name, add_module in MODULE_OPTIONS.items():
+            if name in modules:
+                add_module(self.wegue_conf)
+
+        if "color" in self.options:
+            self.wegue_conf.colorTheme = {
+                "themes": {
+                    "light": {
+                        "primary": self.options["color"]
+                    }
+                }
+            }
+
+    def probe(self, extent, zoom_level):
+        """Optional latency probe of the exported services"""
+
+        extent_3857 = extent2webmercator(extent, self.qgis_instance)
+        results = probe_layers(
+            self.wegue_conf.mapLayers, extent_3857, zoom_level)
+        annotate_report(self.report, results)
+
+    def write_seeding_manifest(self, extent, path):
+        """
+        Lists the tile requests of XYZ and WMS layers for warming
+        tile caches, see wegue_seeding
+        """
+
+        seed_options = self.options["seed"]
+        if not isinstance(seed_options, dict):
+            seed_options = {}
+        expand = seed_options.get("expand", False)
+        max_tiles = seed_options.get("max_tiles", MAX_SEED_TILES)
+
+        seed_extent = seed_options.get("extent") or extent2webmercator(
+            extent, self.qgis_instance)
+        manifest_path = manifest_path_for(path, expand)
+        counts = write_manifest(
+            self.wegue_conf.mapLayers, seed_extent, manifest_path,
+            seed_options.get("min_zoom", DEFAULT_MIN_ZOOM),
+            seed_options.get("max_zoom", DEFAULT_MAX_ZOOM),
+            expand)
+
+        total = sum(counts.values())
+        self.report.add_section("seeding", {
+            "path": manifest_path,
+            "tiles": counts,
+            "total": total
+        })
+        if total > max_tiles:
+            self.report.add_warning(
+                "Seeding manifest lists {} tiles, more than {}".format(
+                    total, max_tiles))
+
+    def estimate_budget(self, path):
+        """Estimates the page weight of the initial view"""
+
+        budget = self.options["budget"]
+        if not isinstance(budget, dict):
+            budget = None
+        estimate = estimate_page_weight(self.wegue_conf, path, budget)
+        check_budget(self.report, estimate, budget)
+
+    def validate(self):
+        """Checks the result against the Wegue schema"""
+
+        self.errors = self.wegue_conf.validate()
+        if self.errors:
+            self.report.add_section("validation", [
+                {"path": path, "message": message}
+                for path, message in self.errors])
+
+    def write(self, path):
+        """
+        Stores the configuration
+
+        An unchanged configuration is not rewritten, so tools watching
+        the file don't see a change. The report is written by run()
+        once all phases are finished.
+        """
+
+        self.written, changes = self.wegue_conf.write_if_changed(path)
+        if self.written:
+            self.report.add_section("changes", changes)
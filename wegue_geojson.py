@@ -0,0 +1,134 @@
+"""
+Export of vector layers as GeoJSON files for the web
+
+Used for sources Wegue can't read directly, e.g. GeoPackage, Shapefile
+or SpatiaLite. Features are read through a feature source, reprojected
+to the Wegue map CRS (EPSG:3857) and written in chunks, so the memory
+use does not depend on the size of the layer. Several layers are
+written in parallel threads.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from qgis.PyQt.QtCore import QDate, QDateTime, QTime, Qt
+from qgis.core import (NULL,
+                       QgsCoordinateReferenceSystem,
+                       QgsFeatureRequest,
+                       QgsVectorLayerFeatureSource)
+
+# providers whose layers are exported
+VECTOR_PROVIDERS = ("ogr", "spatialite")
+
+# number of features written at once
+CHUNK_SIZE = 1000
+
+_HEADER = ('{"type": "FeatureCollection", '
+           '"crs": {"type": "name", "properties": {"name": "EPSG:3857"}}, '
+           '"features": [\n')
+
+
+def needed_fields(layer):
+    """
+    Returns the names of the attributes worth exporting:
+    all fields not hidden in the attribute form of the layer
+    """
+
+    fields = layer.fields()
+    return [field.name() for index, field in enumerate(fields)
+            if layer.editorWidgetSetup(index).type() != "Hidden"]
+
+
+def _json_value(value):
+    if value == NULL or value is None:
+        return None
+    if isinstance(value, (QDate, QDateTime, QTime)):
+        return value.toString(Qt.ISODate)
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+class GeoJsonExportTask:
+    """
+    A single layer export
+
+    Created in the main thread, because the feature source has to be
+    taken from the layer there. run() may then be called in any thread.
+    """
+
+    def __init__(self, layer, path, qgis_instance, precision=2):
+        self.path = path
+        self.precision = precision
+        self.features = 0
+        # message if the export failed
+        self.error = None
+
+        field_names = needed_fields(layer)
+        self.field_names = field_names
+
+        self.source = QgsVectorLayerFeatureSource(layer)
+        self.request = QgsFeatureRequest()
+        self.request.setDestinationCrs(
+            QgsCoordinateReferenceSystem("EPSG:3857"),
+            qgis_instance.transformContext())
+        self.request.setSubsetOfAttributes(field_names, layer.fields())
+
+    def run(self):
+        """
+        Writes the file, a failure is stored in error instead of being
+        raised, so the other tasks are not affected
+        """
+
+        tmp_path = self.path + ".part"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(_HEADER)
+                chunk = []
+                separator = ""
+                for feature in self.source.getFeatures(self.request):
+                    chunk.append(separator + self._feature_json(feature))
+                    separator = ",\n"
+                    if len(chunk) >= CHUNK_SIZE:
+                        f.write("".join(chunk))
+                        chunk = []
+                f.write("".join(chunk))
+                f.write("\n]}\n")
+            os.replace(tmp_path, self.path)
+
+        except Exception as e:
+            self.error = "{}: {}".format(type(e).__name__, e)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+        return self
+
+    def _feature_json(self, feature):
+        self.features += 1
+
+        geometry = feature.geometry()
+        geometry_json = "null"
+        if not geometry.isNull():
+            geometry_json = geometry.asJson(self.precision)
+
+        properties = {
+            name: _json_value(feature[name]) for name in self.field_names}
+
+        return ('{{"type": "Feature", "id": {}, "geometry": {}, '
+                '"properties": {}}}').format(
+            feature.id(), geometry_json,
+            json.dumps(properties, ensure_ascii=False))
+
+
+def export_geojson(tasks, max_workers=None):
+    """
+    Runs several export tasks in parallel threads and returns them,
+    failed tasks have an error message
+    """
+
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as ex:
+        return list(ex.map(GeoJsonExportTask.run, tasks))
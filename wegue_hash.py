@@ -0,0 +1,111 @@
+"""
+Content hashes of Wegue configurations
+
+A configuration is hashed in a canonical form (sorted keys, no
+whitespace), so only real changes lead to a new hash. Besides the hash
+of the whole configuration, every layer, module and top level setting
+is hashed on its own. The hashes are kept in a sidecar file next to
+the configuration and used to tell what changed between two exports.
+"""
+
+import hashlib
+import json
+import os.path
+
+from .wegue_model import SlotsModel
+
+
+def _default(value):
+    if isinstance(value, SlotsModel):
+        return value.to_dict()
+    raise TypeError("Object of type {} is not JSON serializable".format(
+        type(value).__name__))
+
+
+def canonical_hash(value):
+    """Returns the SHA-256 hex digest of the canonical JSON of a value"""
+
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"),
+                           ensure_ascii=False, default=_default)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def conf_hashes(conf):
+    """Returns the hashes of a configuration and of all its parts"""
+
+    layers = {}
+    for index, layer in enumerate(conf.mapLayers):
+        # duplicate ids are a schema error, but must not hide changes
+        key = layer["lid"] if layer["lid"] not in layers else \
+            "{}#{}".format(layer["lid"], index)
+        layers[key] = canonical_hash(layer)
+
+    return {
+        "hash": canonical_hash(conf),
+        "settings": {
+            key: canonical_hash(value) for key, value in conf.items()
+            if key not in ("mapLayers", "modules")},
+        "layers": layers,
+        "modules": {
+            key: canonical_hash(value)
+            for key, value in conf.modules.items()}
+    }
+
+
+def diff_hashes(old, new):
+    """
+    Compares two results of conf_hashes
+
+    Returns added, removed and changed keys for layers, modules and
+    settings.
+    """
+
+    diff = {}
+    for part in ("layers", "modules", "settings"):
+        old_part = old.get(part, {})
+        new_part = new.get(part, {})
+        diff[part] = {
+            "added": [key for key in new_part if key not in old_part],
+            "removed": [key for key in old_part if key not in new_part],
+            "changed": [key for key in new_part
+                        if key in old_part and old_part[key] != new_part[key]]
+        }
+    return diff
+
+
+def hashes_path_for(conf_path):
+    """Returns the sidecar path belonging to a configuration path"""
+
+    return os.path.splitext(conf_path)[0] + ".hashes.json"
+
+
+def read_hashes(conf_path):
+    """Returns the hashes stored for a configuration or an empty dict"""
+
+    try:
+        with open(hashes_path_for(conf_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def file_unchanged(conf_path, hashes):
+    """
+    Checks that the configuration file is still the one the hashes
+    were stored for, i.e. nobody edited it after the last export
+    """
+
+    try:
+        stat = os.stat(conf_path)
+    except OSError:
+        return False
+    return hashes.get("file") == [stat.st_size, stat.st_mtime_ns]
+
+
+def write_hashes(conf_path, hashes):
+    """Stores the hashes along with size and mtime of the config file"""
+
+    stat = os.stat(conf_path)
+    hashes = dict(hashes, file=[stat.st_size, stat.st_mtime_ns])
+    with open(hashes_path_for(conf_path), "w") as f:
+        json.dump(hashes, f, indent=2)
@@ -0,0 +1,252 @@
+"""
+Export of layer legends as static images
+
+Wegue otherwise requests a GetLegendGraphic from the (often slow)
+upstream service every time the layer list is opened. Legends of WMS
+layers are fetched once, all concurrently, and cached by service URL
+and layer name: in memory for the QGIS session and on disk by file
+name, so re-exports don't fetch them again. Legends of all other
+layers are rendered with the QGIS symbology. Optionally all legends
+are also combined into one sprite sheet with a JSON index.
+"""
+
+import hashlib
+import json
+import os
+import re
+
+from qgis.PyQt.QtCore import QSize, Qt
+from qgis.PyQt.QtGui import QImage, QPainter
+from qgis.core import (QgsLayerTree,
+                       QgsLayerTreeModel,
+                       QgsLegendRenderer,
+                       QgsLegendSettings,
+                       QgsRenderContext)
+
+from .wegue_network import get_session
+from .wegue_urls import build_url
+
+# resolution of rendered legends
+LEGEND_DPI = 96
+
+# legend images by (service URL, WMS layer name)
+_legend_cache = {}
+
+
+def legend_request_url(url, layer_name):
+    """Returns the GetLegendGraphic request of a WMS layer"""
+
+    return build_url(url, {
+        "SERVICE": "WMS",
+        "VERSION": "1.1.1",
+        "REQUEST": "GetLegendGraphic",
+        "LAYER": layer_name,
+        "FORMAT": "image/png"
+    })
+
+
+def fetched_legend_name(url, layer_names):
+    """
+    Returns the file name of a fetched legend, derived from the service
+    URL and the layer names, so it is the same on every export
+    """
+
+    key = "\n".join([url] + list(layer_names)).encode("utf-8")
+    return "wms-{}.png".format(hashlib.sha1(key).hexdigest()[:16])
+
+
+def _stack_images(images):
+    """Combines images vertically, left aligned"""
+
+    if len(images) == 1:
+        return images[0]
+
+    width = max(image.width() for image in images)
+    height = sum(image.height() for image in images)
+    result = QImage(width, height, QImage.Format_ARGB32)
+    result.fill(Qt.transparent)
+
+    painter = QPainter(result)
+    y = 0
+    for image in images:
+        painter.drawImage(0, y, image)
+        y += image.height()
+    painter.end()
+    return result
+
+
+def render_legend(layer, dpi=LEGEND_DPI):
+    """Renders the QGIS legend of a layer and returns it as QImage"""
+
+    root = QgsLayerTree()
+    root.addLayer(layer)
+    model = QgsLayerTreeModel(root)
+
+    settings = QgsLegendSettings()
+    settings.setTitle("")
+    renderer = QgsLegendRenderer(model, settings)
+
+    # legend sizes are in millimeters
+    dots_per_mm = dpi / 25.4
+    size = renderer.minimumSize()
+    image = QImage(QSize(max(int(size.width() * dots_per_mm + 0.5), 1),
+                         max(int(size.height() * dots_per_mm + 0.5), 1)),
+                   QImage.Format_ARGB32)
+    image.setDotsPerMeterX(int(dots_per_mm * 1000))
+    image.setDotsPerMeterY(int(dots_per_mm * 1000))
+    image.fill(Qt.transparent)
+
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing)
+    context = QgsRenderContext.fromQPainter(painter)
+    context.setFlag(QgsRenderContext.Antialiasing, True)
+
+    # the legend is drawn in millimeters
+    painter.scale(dots_per_mm, dots_per_mm)
+    context.setScaleFactor(1.0)
+    renderer.drawLegend(context)
+    painter.end()
+    return image
+
+
+class LegendExport:
+    """
+    Legends of several layers
+
+    legend_dir: directory the images are written to
+    legend_url: URL of that directory as seen by the Wegue app
+    endpoints: GetLegendGraphic URL by GetMap URL of the WMS layers,
+        legends of services not listed are requested from the GetMap URL
+    """
+
+    def __init__(self, legend_dir, legend_url, endpoints=None):
+        self.legend_dir = legend_dir
+        self.legend_url = legend_url.rstrip("/")
+        self.endpoints = endpoints or {}
+        self.fetched = 0
+        self.cached = 0
+        self.rendered = 0
+        # (lid, message) of legends that could not be exported
+        self.failed = []
+        # {QGIS layer id: file name}, lids may repeat
+        self.files = {}
+
+    def export(self, items):
+        """
+        Exports the legends of the given layers
+
+        items: list of (Wegue layer, QGIS layer); WMS layers are
+        fetched, other layers are rendered from the QGIS layer, except
+        for tile services (XYZ, WMTS) which have no legend
+        """
+
+        os.makedirs(self.legend_dir, exist_ok=True)
+
+        wms_items = []
+        for wegue_layer, qgis_layer in items:
+            if wegue_layer.type == "WMS":
+                wms_items.append((wegue_layer, qgis_layer))
+            elif qgis_layer.providerType() != "wms":
+                self._render(wegue_layer, qgis_layer)
+
+        self._fetch(wms_items)
+
+    def _fetch(self, items):
+        """Fetches the legends of WMS layers concurrently"""
+
+        # requests of all layers not cached, in one batch
+        requests = []
+        pending = []
+        for wegue_layer, qgis_layer in items:
+            url = self.endpoints.get(wegue_layer.url, wegue_layer.url)
+            layer_names = [name for name in wegue_layer.layers.split(",")
+                           if name]
+            file_name = fetched_legend_name(url, layer_names)
+            path = os.path.join(self.legend_dir, file_name)
+
+            if os.path.exists(path):
+                self.cached += 1
+                self.files[qgis_layer.id()] = file_name
+                continue
+
+            keys = [(url, name) for name in layer_names]
+            for key in keys:
+                if key not in _legend_cache:
+                    requests.append(key)
+            pending.append((wegue_layer, qgis_layer, keys, path))
+
+        requests = list(dict.fromkeys(requests))
+        responses = get_session().fetch_all(
+            [legend_request_url(url, name) for url, name in requests])
+        for key, response in zip(requests, responses):
+            content_type = response.headers.get("content-type", "")
+            if response.ok and content_type.startswith("image/"):
+                image = QImage.fromData(response.content)
+                if not image.isNull():
+                    _legend_cache[key] = image
+                    self.fetched += 1
+
+        for wegue_layer, qgis_layer, keys, path in pending:
+            images = [_legend_cache[key] for key in keys
+                      if key in _legend_cache]
+            if len(images) < len(keys):
+                self.failed.append(
+                    (wegue_layer.lid, "GetLegendGraphic failed"))
+                continue
+            self._save(wegue_layer, qgis_layer, _stack_images(images), path)
+
+    def _render(self, wegue_layer, qgis_layer):
+        # layer ids are unique, but may contain e.g. slashes
+        file_name = re.sub(r"[^\w.-]", "_", qgis_layer.id()) + ".png"
+        path = os.path.join(self.legend_dir, file_name)
+        self._save(wegue_layer, qgis_layer, render_legend(qgis_layer), path)
+        self.rendered += 1
+
+    def _save(self, wegue_layer, qgis_layer, image, path):
+        tmp_path = path + ".part"
+        if image.save(tmp_path, "PNG"):
+            os.replace(tmp_path, path)
+            self.files[qgis_layer.id()] = os.path.basename(path)
+        else:
+            self.failed.append((wegue_layer.lid, "could not write image"))
+
+    def apply(self, items):
+        """
+        Points the layers to their legend images
+
+        items: list of (Wegue layer, QGIS layer) as given to export
+        """
+
+        for wegue_layer, qgis_layer in items:
+            file_name = self.files.get(qgis_layer.id())
+            if file_name is not None:
+                wegue_layer.legendUrl = "{}/{}".format(
+                    self.legend_url, file_name)
+
+    def write_sprite(self, name="sprite"):
+        """
+        Combines all legends into one image with a JSON index
+        {legend file name: {"x", "y", "width", "height"}} and returns
+        its path; the file names are those of the layers' legendUrl
+        """
+
+        images = []
+        index = {}
+        y = 0
+        for file_name in dict.fromkeys(self.files.values()):
+            image = QImage(os.path.join(self.legend_dir, file_name))
+            if image.isNull():
+                continue
+            index[file_name] = {"x": 0, "y": y, "width": image.width(),
+                                "height": image.height()}
+            images.append(image)
+            y += image.height()
+
+        if not images:
+            return None
+
+        path = os.path.join(self.legend_dir, name + ".png")
+        _stack_images(images).save(path, "PNG")
+        with open(os.path.join(self.legend_dir, name + ".json"), "w") as f:
+            json.dump(index, f, indent=2)
+        return path
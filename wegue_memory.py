@@ -0,0 +1,76 @@
+"""
+Memory profiling of exports with tracemalloc
+
+Takes a snapshot before and after every export phase and keeps the
+allocation sites that grew the most and the peak of the traced memory.
+Tracing slows Python code down noticeably, so it is opt-in.
+"""
+
+import tracemalloc
+
+# allocation sites listed per phase
+TOP_SITES = 10
+
+
+class MemoryProfiler:
+    """Collects tracemalloc statistics of named phases"""
+
+    def __init__(self, top=TOP_SITES):
+        self.top = top
+        self.phases = {}
+        self._started = False
+        self._before = None
+
+    def start(self):
+        # an already running trace, e.g. by -X tracemalloc, is reused
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started = True
+
+    def stop(self):
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+
+    def phase_started(self):
+        self._before = tracemalloc.take_snapshot()
+        # Python < 3.9 can't reset the peak, it then covers all phases
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+    def phase_finished(self, name):
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+
+        # allocations of the profiler itself are left out
+        snapshot_filter = tracemalloc.Filter(False, tracemalloc.__file__)
+        stats = after.filter_traces([snapshot_filter]).compare_to(
+            self._before.filter_traces([snapshot_filter]), "lineno")
+        self._before = None
+
+        self.phases[name] = {
+            "size_diff": sum(stat.size_diff for stat in stats),
+            "current": current,
+            "peak": peak,
+            "top": [
+                {"site": "{}:{}".format(stat.traceback[0].filename,
+                                        stat.traceback[0].lineno),
+                 "size_diff": stat.size_diff,
+                 "count_diff": stat.count_diff}
+                for stat in stats[:self.top]]
+        }
+
+    @property
+    def peak(self):
+        """Highest traced memory of all phases in bytes"""
+
+        return max([phase["peak"] for phase in self.phases.values()],
+                   default=0)
+
+    def to_report(self, report):
+        """Adds the statistics as "memory" section to an export report"""
+
+        report.add_section("memory", {
+            "peak": self.peak,
+            "phases": self.phases
+        })
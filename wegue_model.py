@@ -0,0 +1,154 @@
+"""
+Base class and JSON writer for the typed configuration model
+
+Model classes declare their fields in ``__slots__``. The order of the
+slots is the order of the keys in the written JSON, fields set to None
+are left out. The writer streams the model straight into a file without
+building intermediate dicts.
+"""
+
+from json.encoder import encode_basestring
+from operator import attrgetter
+
+_INFINITY = float("inf")
+
+
+class SlotsModel:
+    """
+    Base class for configuration objects with a fixed field order
+
+    Provides the read-only part of the dict interface, so models can be
+    used wherever a JSON object is expected. Subclasses set every slot
+    in __init__, None for unset fields, so all fields of an object are
+    read at once with one attrgetter instead of one getattr per field.
+    """
+
+    __slots__ = ()
+
+    # set per subclass by __init_subclass__
+    _fields = ()
+    _field_set = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = tuple(cls.__slots__)
+        cls._field_set = frozenset(cls._fields)
+        getter = attrgetter(*cls._fields)
+        if len(cls._fields) == 1:
+            cls._field_values = staticmethod(lambda obj: (getter(obj),))
+        else:
+            cls._field_values = staticmethod(getter)
+
+    @staticmethod
+    def _field_values(obj):
+        return ()
+
+    def items(self):
+        for field, value in zip(self._fields, self._field_values(self)):
+            if value is not None:
+                yield field, value
+
+    def keys(self):
+        return [field for field, _ in self.items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        return (key in self._field_set and
+                getattr(self, key) is not None)
+
+    def __getitem__(self, key):
+        value = getattr(self, key) if key in self._field_set else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = getattr(self, key) if key in self._field_set else None
+        return default if value is None else value
+
+    def to_dict(self):
+        """Returns a plain (nested) dict copy of the model"""
+
+        return {key: _to_plain(value) for key, value in self.items()}
+
+
+def _to_plain(value):
+    if isinstance(value, SlotsModel):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {key: _to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_plain(item) for item in value]
+    return value
+
+
+def _float_repr(value):
+    if value != value:
+        return "NaN"
+    if value == _INFINITY:
+        return "Infinity"
+    if value == -_INFINITY:
+        return "-Infinity"
+    return float.__repr__(value)
+
+
+def write_json(value, fp, indent=2):
+    """
+    Writes models, dicts, lists and scalars as JSON to a file object
+
+    The output matches ``json.dump(value, fp, indent=indent,
+    ensure_ascii=False)`` for the equivalent dicts.
+    """
+
+    write = fp.write
+
+    def write_value(value, newline):
+        if isinstance(value, str):
+            write(encode_basestring(value))
+        elif value is None:
+            write("null")
+        elif value is True:
+            write("true")
+        elif value is False:
+            write("false")
+        elif isinstance(value, int):
+            write(int.__repr__(value))
+        elif isinstance(value, float):
+            write(_float_repr(value))
+        elif isinstance(value, (SlotsModel, dict)):
+            write_object(value, newline)
+        elif isinstance(value, (list, tuple)):
+            write_array(value, newline)
+        else:
+            raise TypeError("Object of type {} is not JSON serializable"
+                            .format(type(value).__name__))
+
+    def write_object(value, newline):
+        inner = newline + " " * indent
+        separator = "{" + inner
+        for key, item in value.items():
+            write(separator)
+            write(encode_basestring(key))
+            write(": ")
+            write_value(item, inner)
+            separator = "," + inner
+        if separator[0] == "{":
+            write("{}")
+        else:
+            write(newline + "}")
+
+    def write_array(value, newline):
+        if not value:
+            write("[]")
+            return
+        inner = newline + " " * indent
+        separator = "[" + inner
+        for item in value:
+            write(separator)
+            write_value(item, inner)
+            separator = "," + inner
+        write(newline + "]")
+
+    write_value(value, "\n")
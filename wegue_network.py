@@ -0,0 +1,395 @@
+"""
+HTTP transport for all network access of the plugin
+
+Requests go through QgsNetworkAccessManager, so the proxy, SSL and
+authentication settings of QGIS apply. The manager keeps connections
+alive and pools them per host, which makes repeated requests to the
+same service cheap. On top of that this module adds per request
+timeouts, an overall deadline and bounded retries with exponential
+backoff, so a single hanging service cannot stall an export.
+
+A request may pass its body to a consumer while it is downloaded
+instead of buffering it. The consumer can end the download early once
+it has what it needs, e.g. the first kilobytes of a large document.
+"""
+
+import time
+
+from qgis.PyQt.QtCore import QEventLoop, QTimer, QUrl
+from qgis.PyQt.QtNetwork import QNetworkReply, QNetworkRequest
+from qgis.core import QgsApplication, QgsNetworkAccessManager
+
+
+# network errors that are worth another attempt
+_RETRY_ERRORS = (
+    QNetworkReply.ConnectionRefusedError,
+    QNetworkReply.RemoteHostClosedError,
+    QNetworkReply.TimeoutError,
+    QNetworkReply.TemporaryNetworkFailureError,
+    QNetworkReply.NetworkSessionFailedError,
+    QNetworkReply.ProxyTimeoutError,
+    QNetworkReply.UnknownNetworkError
+)
+
+# HTTP status codes that are worth another attempt
+_RETRY_STATUS = (429, 502, 503, 504)
+
+# upper limit for a single backoff pause in seconds
+_MAX_BACKOFF = 8.0
+
+
+class NetworkError(Exception):
+    """Raised when a request finally failed"""
+
+
+class HttpResponse:
+    """
+    Result of a single request
+
+    content is empty for bodies passed to a consumer (streamed).
+    """
+
+    def __init__(self, url, method="GET"):
+        self.url = url
+        self.method = method
+        self.status = None
+        self.headers = {}
+        self.content = b""
+        self.streamed = False
+        self.error = None
+        self.attempts = 0
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return (self.error is None and self.status is not None and
+                200 <= self.status < 300)
+
+    def raise_for_error(self):
+        """Raises a NetworkError in case the request failed"""
+
+        if not self.ok:
+            raise NetworkError("{} {} failed after {} attempt(s): {}".format(
+                self.method, self.url, self.attempts,
+                self.error or "HTTP {}".format(self.status)))
+
+
+class _Transfer:
+    """A single request including its retries"""
+
+    def __init__(self, session, method, url, headers, deadline_at,
+                 on_done, on_data=None):
+        self.session = session
+        self.method = method
+        self.url = url
+        self.headers = headers or {}
+        self.deadline_at = deadline_at
+        self.on_done = on_done
+        self.on_data = on_data
+        self.response = HttpResponse(url, method)
+        self.reply = None
+        self.timer = None
+        self.timed_out = False
+        # the consumer needs no more data, the reply was aborted for that
+        self.stream_done = False
+        # exception raised by the consumer
+        self.stream_error = None
+        self.started = time.monotonic()
+        self.finished = False
+
+    def send(self):
+        # a retry scheduled before the batch was aborted
+        if self.finished:
+            return
+
+        remaining = self.deadline_at - time.monotonic()
+        if remaining <= 0:
+            self.response.error = "deadline exceeded"
+            self.finish()
+            return
+
+        request = QNetworkRequest(QUrl(self.url))
+        request.setAttribute(QNetworkRequest.FollowRedirectsAttribute, True)
+        request.setPriority(self.session.priority)
+        for key, value in self.headers.items():
+            request.setRawHeader(key.encode(), value.encode())
+        if self.session.authcfg:
+            QgsApplication.authManager().updateNetworkRequest(
+                request, self.session.authcfg)
+
+        manager = QgsNetworkAccessManager.instance()
+        if self.method == "HEAD":
+            self.reply = manager.head(request)
+        else:
+            self.reply = manager.get(request)
+        self.response.attempts += 1
+        self.timed_out = False
+        self.reply.finished.connect(self.handle_reply)
+        if self.on_data is not None:
+            self.reply.readyRead.connect(self.handle_ready_read)
+
+        # abort when the request timeout or the overall deadline is reached
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.handle_timeout)
+        self.timer.start(int(min(self.session.timeout, remaining) * 1000))
+
+    def handle_timeout(self):
+        if self.reply is not None:
+            self.timed_out = True
+            self.reply.abort()
+
+    def handle_ready_read(self):
+        reply = self.reply
+        if reply is None or self.stream_done:
+            return
+        status = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+        if status is None or not 200 <= status < 300:
+            # error bodies are buffered as usual
+            return
+
+        self.response.streamed = True
+        try:
+            self.stream_done = bool(self.on_data(bytes(reply.readAll())))
+        except Exception as e:
+            self.stream_error = str(e)
+            self.stream_done = True
+        if self.stream_done and not reply.isFinished():
+            reply.abort()
+
+    def handle_reply(self):
+        self.timer.stop()
+        if self.on_data is not None:
+            # data arriving together with the end of the reply
+            self.handle_ready_read()
+        reply, self.reply = self.reply, None
+
+        response = self.response
+        response.status = reply.attribute(
+            QNetworkRequest.HttpStatusCodeAttribute)
+        response.headers = {
+            bytes(key).decode("latin-1").lower():
+                bytes(value).decode("latin-1")
+            for key, value in reply.rawHeaderPairs()}
+        response.content = bytes(reply.readAll())
+        error = reply.error()
+        if self.stream_done:
+            response.error = self.stream_error
+            error = QNetworkReply.NoError
+        elif self.timed_out:
+            response.error = "timed out"
+            error = QNetworkReply.TimeoutError
+        elif error != QNetworkReply.NoError and (
+                response.status is None or response.streamed):
+            # a consumer was left with an incomplete body
+            response.error = reply.errorString()
+        else:
+            response.error = None
+        reply.deleteLater()
+
+        # a consumer can't take the same data twice
+        retry = not response.streamed and (
+            error in _RETRY_ERRORS or response.status in _RETRY_STATUS)
+        if retry and response.attempts <= self.session.retries:
+            pause = min(self.session.backoff * 2 ** (response.attempts - 1),
+                        _MAX_BACKOFF)
+            if time.monotonic() + pause < self.deadline_at:
+                QTimer.singleShot(int(pause * 1000), self.send)
+                return
+
+        self.finish()
+
+    def abort(self, reason):
+        if self.finished:
+            return
+        if self.reply is not None:
+            # finish() is called by handle_reply
+            self.timed_out = True
+            self.reply.abort()
+        else:
+            # waiting for a retry
+            self.response.error = reason
+            self.finish()
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        self.response.elapsed = time.monotonic() - self.started
+        self.on_done(self)
+
+
+class _Batch:
+    """Several transfers running concurrently under one deadline"""
+
+    def __init__(self, session, requests, deadline_at, on_done):
+        self.on_done = on_done
+        self.pending = set()
+        self.transfers = []
+        for request in requests:
+            if isinstance(request, str):
+                method, url, headers, on_data = "GET", request, None, None
+            else:
+                method, url, headers, *on_data = request
+                on_data = on_data[0] if on_data else None
+            self.transfers.append(_Transfer(
+                session, method, url, headers, deadline_at,
+                self.transfer_done, on_data))
+        self.pending.update(self.transfers)
+        self.deadline_at = deadline_at
+        self.deadline_timer = None
+        self.finished = False
+
+    def start(self):
+        # abort everything left when the overall deadline is reached
+        self.deadline_timer = QTimer()
+        self.deadline_timer.setSingleShot(True)
+        self.deadline_timer.timeout.connect(self.abort)
+        self.deadline_timer.start(
+            int(max(self.deadline_at - time.monotonic(), 0) * 1000))
+
+        for transfer in self.transfers:
+            transfer.send()
+
+        if not self.pending:
+            self.finish()
+
+    def transfer_done(self, transfer):
+        self.pending.discard(transfer)
+        if not self.pending:
+            self.finish()
+
+    def abort(self):
+        for transfer in list(self.pending):
+            transfer.abort("deadline exceeded")
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        self.deadline_timer.stop()
+        self.on_done([transfer.response for transfer in self.transfers])
+
+
+class NetworkSession:
+    """
+    Shared entry point for HTTP requests
+
+    timeout: seconds a single attempt may take
+    deadline: seconds a call of fetch_all / fetch_async may take in total
+    retries: additional attempts for temporary failures
+    backoff: pause in seconds before the first retry, doubled afterwards
+    authcfg: optional id of a QGIS authentication configuration
+    priority: QNetworkRequest priority, e.g. LowPriority for background
+    requests that should not delay the ones the user waits for
+    """
+
+    def __init__(self, timeout=10.0, deadline=60.0, retries=2,
+                 backoff=0.5, authcfg=None,
+                 priority=QNetworkRequest.NormalPriority):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.authcfg = authcfg
+        self.priority = priority
+
+    def with_authcfg(self, authcfg):
+        """
+        Returns a session with the same settings using the given
+        QGIS authentication configuration
+
+        Both sessions share the connection pool of the network manager.
+        """
+
+        if not authcfg or authcfg == self.authcfg:
+            return self
+        return NetworkSession(self.timeout, self.deadline, self.retries,
+                              self.backoff, authcfg, self.priority)
+
+    def fetch_async(self, requests, callback, deadline=None):
+        """
+        Starts several requests concurrently without waiting
+
+        ``callback`` is called with the list of HttpResponse objects
+        once all requests are finished. Requests and responses are the
+        same as in fetch_all. Returns immediately, the requests are
+        handled by the Qt event loop.
+        """
+
+        deadline_at = time.monotonic() + (
+            deadline if deadline is not None else self.deadline)
+
+        def batch_done(responses):
+            _running_batches.discard(batch)
+            callback(responses)
+
+        batch = _Batch(self, requests, deadline_at, batch_done)
+
+        # keeps the batch alive until it is finished
+        _running_batches.add(batch)
+        batch.start()
+
+    def fetch_all(self, requests, deadline=None):
+        """
+        Runs several requests concurrently and waits for all of them
+
+        ``requests`` is a list of URLs or (method, url, headers) tuples.
+        A fourth item, ``on_data``, streams a successful body: it is
+        called with every piece as it arrives and may return True to
+        abort the download, because it needs nothing more. Exceptions
+        it raises end the download and become the error of the
+        response. Streamed requests are not retried once data arrived.
+
+        Returns a HttpResponse for every request in the same order,
+        failed requests have their ``error`` set instead of raising.
+        """
+
+        deadline_at = time.monotonic() + (
+            deadline if deadline is not None else self.deadline)
+
+        loop = QEventLoop()
+        result = []
+
+        def batch_done(responses):
+            result.extend(responses)
+            loop.quit()
+
+        batch = _Batch(self, requests, deadline_at, batch_done)
+        batch.start()
+        if not batch.finished:
+            loop.exec_()
+
+        return result
+
+
+_session = None
+
+_background_session = None
+
+# batches started by fetch_async which are not finished yet
+_running_batches = set()
+
+
+def get_session():
+    """Returns the session shared by all modules of the plugin"""
+
+    global _session
+    if _session is None:
+        _session = NetworkSession()
+    return _session
+
+
+def get_background_session():
+    """
+    Returns the shared session for background requests
+
+    Requests are sent with low priority and without retries, so they
+    never hold up requests the user is waiting for.
+    """
+
+    global _background_session
+    if _background_session is None:
+        _background_session = NetworkSession(
+            retries=0, priority=QNetworkRequest.LowPriority)
+    return _background_session
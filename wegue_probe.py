@@ -0,0 +1,121 @@
+"""
+Latency probe for the services of exported layers
+
+For every WMS, XYZ and WFS layer one representative request is sent
+over the exported extent. All requests run concurrently, so the probe
+takes about as long as the slowest service.
+"""
+
+from .wegue_network import NetworkSession
+from .wegue_urls import build_url, is_remote
+from .wegue_tilemath import fill_tile_url, tile_for_point
+
+# width of the probed GetMap image in pixels
+PROBE_IMAGE_WIDTH = 512
+
+# layers slower than this (in seconds) are reported as warnings
+SLOW_LAYER_SECONDS = 1.0
+
+
+def build_probe_url(layer, extent, zoom):
+    """
+    Returns the URL of a representative request for a layer
+    or None if the layer type can't be probed or the layer is served
+    from local files, e.g. rendered tiles
+
+    extent: [minx, miny, maxx, maxy] in EPSG:3857
+    """
+
+    if not layer.url or not is_remote(layer.url):
+        return None
+
+    layer_type = layer.type
+    minx, miny, maxx, maxy = extent
+    bbox = ",".join(str(v) for v in extent)
+
+    if layer_type == "XYZ":
+        # tile in the center of the extent
+        tile_x, tile_y = tile_for_point(
+            (minx + maxx) / 2, (miny + maxy) / 2, zoom)
+        return fill_tile_url(layer.url, zoom, tile_x, tile_y)
+
+    elif layer_type == "WMS":
+        width = PROBE_IMAGE_WIDTH
+        height = max(int(width * (maxy - miny) / max(maxx - minx, 1e-9)), 1)
+        return build_url(layer.url, {
+            "SERVICE": "WMS",
+            "VERSION": "1.1.1",
+            "REQUEST": "GetMap",
+            "LAYERS": layer.layers,
+            "STYLES": "",
+            "SRS": "EPSG:3857",
+            "BBOX": bbox,
+            "WIDTH": str(width),
+            "HEIGHT": str(min(height, 4 * width)),
+            "FORMAT": "image/png",
+            "TRANSPARENT": "TRUE"
+        })
+
+    elif layer_type == "WFS":
+        return build_url(layer.url, {
+            "SERVICE": "WFS",
+            "VERSION": "1.1.0",
+            "REQUEST": "GetFeature",
+            "TYPENAME": layer.typeName,
+            "RESULTTYPE": "hits",
+            "BBOX": bbox + ",EPSG:3857"
+        })
+
+    return None
+
+
+def probe_layers(layers, extent, zoom, timeout=15.0):
+    """
+    Measures latency and payload size of the given Wegue layers
+
+    Returns a list of result dicts ranked by latency, slowest first.
+    """
+
+    probes = []
+    for layer in layers:
+        url = build_probe_url(layer, extent, zoom)
+        if url is not None:
+            probes.append((layer, url))
+
+    # no retries, the first answer is what a browser would see
+    session = NetworkSession(timeout=timeout, deadline=timeout + 5,
+                             retries=0)
+    responses = session.fetch_all([url for _, url in probes])
+
+    results = []
+    for (layer, url), response in zip(probes, responses):
+        results.append({
+            "lid": layer.lid,
+            "name": layer.name,
+            "type": layer.type,
+            "url": url,
+            "status": response.status,
+            "error": response.error,
+            "seconds": round(response.elapsed, 3),
+            "bytes": len(response.content)
+        })
+
+    results.sort(key=lambda result: result["seconds"], reverse=True)
+    return results
+
+
+def annotate_report(report, results, slow_seconds=SLOW_LAYER_SECONDS):
+    """Adds probe results and warnings for slow layers to a report"""
+
+    report.add_section("probe", results)
+
+    for result in results:
+        if result["error"] or not result["status"] or \
+                result["status"] >= 400:
+            report.add_warning("Layer '{}' failed the probe: {}".format(
+                result["lid"],
+                result["error"] or "HTTP {}".format(result["status"])))
+        elif result["seconds"] > slow_seconds:
+            report.add_warning(
+                "Layer '{}' is slow: {} s for {} bytes".format(
+                    result["lid"], result["seconds"], result["bytes"]))
@@ -0,0 +1,158 @@
+"""
+Publishing of local vector files under content-hashed names
+
+Local files referenced by layers are placed in an asset directory as
+<name>.<hash>.<extension> and the layer URLs are rewritten to the
+public path of the asset directory. A changed file gets a new name, so
+the assets can be served with ``Cache-Control: immutable``.
+
+Files are hashed in blocks and the hashes are cached by path, size and
+modification time in a file next to the configuration, outside the
+public asset directory, so unchanged files are not read again. Assets
+are copies of the source files or, on request, hard links. A hard link
+shares the content with the source, so it must not be used for files
+edited in place. Old assets are kept for clients still using an older
+configuration.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+from .wegue_urls import local_path
+
+# bytes read at once while hashing
+BLOCK_SIZE = 1024 * 1024
+
+# hex digits of the hash in the file names
+HASH_LENGTH = 16
+
+
+def file_hash(path):
+    """Returns the SHA-256 hex digest of a file, read in blocks"""
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def publish_cache_path_for(conf_path):
+    """Returns the path of the hash cache belonging to a configuration"""
+
+    return os.path.splitext(conf_path)[0] + ".publish-cache.json"
+
+
+def hashed_name(path, digest):
+    """Returns the asset file name of a source file"""
+
+    stem, extension = os.path.splitext(os.path.basename(path))
+    return "{}.{}{}".format(stem, digest[:HASH_LENGTH], extension)
+
+
+class AssetPublisher:
+    """
+    Places local files in an asset directory
+
+    asset_dir: directory the assets are written to
+    public_url: URL of the asset directory as seen by the Wegue app
+    cache_path: file the hashes are cached in, see publish_cache_path_for
+    link: hard link assets instead of copying them if possible
+    """
+
+    def __init__(self, asset_dir, public_url, cache_path, link=False):
+        self.asset_dir = asset_dir
+        self.cache_path = cache_path
+        self.public_url = public_url.rstrip("/")
+        self.link = link
+        self.linked = 0
+        self.copied = 0
+        self.existing = 0
+        self.hashed = 0
+
+        # {source path: [size, mtime_ns, digest]}
+        self._cache = {}
+        try:
+            with open(cache_path) as f:
+                self._cache = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def _digest(self, path):
+        """Returns the hash of a file, from the cache if unchanged"""
+
+        stat = os.stat(path)
+        cached = self._cache.get(path)
+        if cached and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+
+        digest = file_hash(path)
+        self.hashed += 1
+        self._cache[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def publish(self, path):
+        """Places a file in the asset directory and returns its URL"""
+
+        path = os.path.abspath(path)
+        name = hashed_name(path, self._digest(path))
+        target = os.path.join(self.asset_dir, name)
+
+        if os.path.exists(target):
+            self.existing += 1
+        else:
+            os.makedirs(self.asset_dir, exist_ok=True)
+            tmp_path = target + ".part"
+            linked = False
+            if self.link:
+                try:
+                    os.link(path, tmp_path)
+                    linked = True
+                except OSError:
+                    # other file system or no hard links supported
+                    pass
+            if linked:
+                self.linked += 1
+            else:
+                shutil.copyfile(path, tmp_path)
+                self.copied += 1
+            os.replace(tmp_path, target)
+
+        return self.public_url + "/" + name
+
+    def save_cache(self):
+        """Stores the hashes for the next export"""
+
+        if not self.hashed:
+            return
+        with open(self.cache_path, "w") as f:
+            json.dump(self._cache, f)
+
+
+def publish_layers(layers, base_dir, publisher):
+    """
+    Publishes the local files of vector layers and rewrites their URLs
+
+    base_dir: directory relative URLs are resolved against
+    Returns a list of (layer, source path, error message or None).
+    """
+
+    results = []
+    for layer in layers:
+        if layer.type != "VECTOR" or not layer.url:
+            continue
+        path = local_path(layer.url, base_dir)
+        if path is None:
+            continue
+
+        try:
+            layer.url = publisher.publish(path)
+        except OSError as e:
+            results.append((layer, path, str(e)))
+        else:
+            results.append((layer, path, None))
+
+    publisher.save_cache()
+    return results
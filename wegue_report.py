@@ -0,0 +1,40 @@
+import json
+import os.path
+from collections import OrderedDict
+
+
+class ExportReport:
+    """
+    Collects warnings and results of optional export stages
+
+    The report is stored as JSON next to the Wegue configuration.
+    """
+
+    def __init__(self):
+        self.warnings = []
+        self.sections = OrderedDict()
+
+    def add_warning(self, message):
+        self.warnings.append(message)
+
+    def add_section(self, name, content):
+        self.sections[name] = content
+
+    def is_empty(self):
+        return not self.warnings and not self.sections
+
+    def to_file(self, path):
+        """Store report as JSON file"""
+
+        report = OrderedDict()
+        report["warnings"] = self.warnings
+        report.update(self.sections)
+
+        with open(path, "w") as path:
+            json.dump(report, path, indent=2, ensure_ascii=False)
+
+
+def report_path_for(conf_path):
+    """Returns the report path belonging to a configuration path"""
+
+    return os.path.splitext(conf_path)[0] + ".report.json"
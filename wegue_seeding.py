@@ -0,0 +1,182 @@
+"""
+Tile seeding manifest for exported XYZ and WMS layers
+
+Lists the tile requests of every XYZ and WMS layer over an extent and a
+zoom range, so a seeder can warm a tile cache before the first users
+arrive. Two formats are written:
+
+- ranges (default): one JSON line per layer and zoom level
+
+    {"lid": "osm", "template": "https://.../{z}/{x}/{y}.png",
+     "z": 12, "x": [2140, 2152], "y": [1390, 1398], "count": 117}
+
+- expanded: one request URL per line
+
+WMS layers are requested by Wegue as 256 pixel tiles of the XYZ grid.
+Their template has a ``{bbox}`` placeholder for the EPSG:3857 bounds
+of tile z/x/y. Lines are written while they are computed, the manifest
+is never held in memory.
+"""
+
+import json
+import os
+
+from .wegue_tilemath import (ORIGIN_SHIFT,
+                             TILE_SIZE,
+                             fill_tile_url,
+                             resolution_for_zoom,
+                             tile_range)
+from .wegue_urls import build_url, is_remote
+
+# zoom levels seeded if not given in the options
+DEFAULT_MIN_ZOOM = 0
+DEFAULT_MAX_ZOOM = 16
+
+
+def seeding_template(layer):
+    """
+    Returns the request template of a XYZ or WMS layer
+    or None for other layer types and layers not served over HTTP(S),
+    e.g. tiles rendered by the export
+    """
+
+    if not layer.url or not is_remote(layer.url):
+        return None
+
+    if layer.type == "XYZ":
+        return layer.url
+
+    if layer.type == "WMS":
+        url = build_url(layer.url, {
+            "SERVICE": "WMS",
+            "VERSION": "1.1.1",
+            "REQUEST": "GetMap",
+            "LAYERS": layer.layers,
+            "STYLES": "",
+            "SRS": "EPSG:3857",
+            "WIDTH": str(TILE_SIZE),
+            "HEIGHT": str(TILE_SIZE),
+            "FORMAT": "image/png",
+            "TRANSPARENT": "TRUE"
+        })
+        # added afterwards, urlencode would escape the braces
+        return url + "&BBOX={bbox}"
+
+    return None
+
+
+def zoom_levels(layer, min_zoom, max_zoom):
+    """
+    Returns the zoom levels of the range at which OpenLayers shows
+    the layer according to its min/maxResolution
+    """
+
+    min_resolution = layer.get("minResolution")
+    max_resolution = layer.get("maxResolution")
+
+    levels = []
+    for zoom in range(min_zoom, max_zoom + 1):
+        resolution = resolution_for_zoom(zoom)
+        if min_resolution is not None and resolution < min_resolution:
+            continue
+        if max_resolution is not None and resolution >= max_resolution:
+            continue
+        levels.append(zoom)
+    return levels
+
+
+def _tile_edges(zoom, first, last):
+    """
+    Returns the coordinates of the tile edges first..last + 1 along an
+    axis as strings, computed once per zoom instead of once per tile
+    """
+
+    size = 2 * ORIGIN_SHIFT / 2 ** zoom
+    return [repr(-ORIGIN_SHIFT + index * size)
+            for index in range(first, last + 2)]
+
+
+def _expanded_rows(template, zoom, min_x, min_y, max_x, max_y):
+    """
+    Yields the request URLs of a tile range, one list per tile row
+
+    Everything shared by a row is filled in once, per tile only the
+    x index or the x edges are inserted.
+    """
+
+    tiles = 2 ** zoom
+    columns = range(min_x, max_x + 1)
+
+    if "{bbox}" not in template:
+        for tile_y in range(min_y, max_y + 1):
+            row_template = fill_tile_url(template, zoom, "{x}", tile_y)
+            prefix, suffix = row_template.split("{x}", 1)
+            yield [prefix + str(tile_x) + suffix for tile_x in columns]
+        return
+
+    x_edges = _tile_edges(zoom, min_x, max_x)
+    # tile rows count from the top, y edges from the bottom
+    y_edges = _tile_edges(zoom, tiles - 1 - max_y, tiles - 1 - min_y)
+    prefix, suffix = template.split("{bbox}", 1)
+
+    for tile_y in range(min_y, max_y + 1):
+        row = max_y - tile_y
+        miny, maxy = y_edges[row], y_edges[row + 1]
+        yield [
+            "{}{},{},{},{}{}".format(prefix, x_edges[i], miny,
+                                     x_edges[i + 1], maxy, suffix)
+            for i in range(len(columns))]
+
+
+def write_manifest(layers, extent, path, min_zoom=DEFAULT_MIN_ZOOM,
+                   max_zoom=DEFAULT_MAX_ZOOM, expand=False):
+    """
+    Writes the seeding manifest of the given Wegue layers
+
+    extent: [minx, miny, maxx, maxy] in EPSG:3857
+    expand: one URL per line instead of one tile range per line
+
+    Returns the number of tiles by layer id.
+    """
+
+    counts = {}
+    tmp_path = path + ".part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for layer in layers:
+            template = seeding_template(layer)
+            if template is None:
+                continue
+
+            count = 0
+            for zoom in zoom_levels(layer, min_zoom, max_zoom):
+                min_x, min_y, max_x, max_y = tile_range(extent, zoom)
+                tiles = (max_x - min_x + 1) * (max_y - min_y + 1)
+                count += tiles
+
+                if expand:
+                    for urls in _expanded_rows(template, zoom, min_x, min_y,
+                                               max_x, max_y):
+                        f.write("\n".join(urls))
+                        f.write("\n")
+                else:
+                    f.write(json.dumps({
+                        "lid": layer.lid,
+                        "template": template,
+                        "z": zoom,
+                        "x": [min_x, max_x],
+                        "y": [min_y, max_y],
+                        "count": tiles
+                    }, separators=(",", ":")))
+                    f.write("\n")
+
+            counts[layer.lid] = count
+
+    os.replace(tmp_path, path)
+    return counts
+
+
+def manifest_path_for(conf_path, expand=False):
+    """Returns the manifest path belonging to a configuration path"""
+
+    extension = ".seed.txt" if expand else ".seed.jsonl"
+    return os.path.splitext(conf_path)[0] + extension
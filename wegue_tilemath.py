@@ -0,0 +1,58 @@
+"""
+Tile grid calculations for the WebMercator (EPSG:3857) XYZ scheme
+used by Wegue and OpenLayers
+"""
+
+import math
+
+# half of the circumference of the earth in EPSG:3857 units
+ORIGIN_SHIFT = 20037508.342789244
+
+TILE_SIZE = 256
+
+
+def resolution_for_zoom(zoom):
+    """Returns map units per pixel of a zoom level"""
+
+    return 2 * ORIGIN_SHIFT / (TILE_SIZE * 2 ** zoom)
+
+
+def tile_for_point(x, y, zoom):
+    """Returns the (x, y) index of the tile containing a point"""
+
+    tiles = 2 ** zoom
+    tile_x = int(math.floor((x + ORIGIN_SHIFT) / (2 * ORIGIN_SHIFT) * tiles))
+    tile_y = int(math.floor((ORIGIN_SHIFT - y) / (2 * ORIGIN_SHIFT) * tiles))
+
+    # points on the border of the world belong to the last tile
+    return (min(max(tile_x, 0), tiles - 1),
+            min(max(tile_y, 0), tiles - 1))
+
+
+def tile_bounds(zoom, tile_x, tile_y):
+    """Returns [minx, miny, maxx, maxy] of a tile in EPSG:3857"""
+
+    size = 2 * ORIGIN_SHIFT / 2 ** zoom
+    minx = -ORIGIN_SHIFT + tile_x * size
+    maxy = ORIGIN_SHIFT - tile_y * size
+    return [minx, maxy - size, minx + size, maxy]
+
+
+def tile_range(extent, zoom):
+    """
+    Returns the inclusive tile index range (min_x, min_y, max_x, max_y)
+    covering an extent [minx, miny, maxx, maxy] in EPSG:3857
+    """
+
+    min_x, min_y = tile_for_point(extent[0], extent[3], zoom)
+    max_x, max_y = tile_for_point(extent[2], extent[1], zoom)
+    return min_x, min_y, max_x, max_y
+
+
+def fill_tile_url(url, zoom, tile_x, tile_y):
+    """Replaces the placeholders of a XYZ URL template"""
+
+    return (url.replace("{z}", str(zoom))
+            .replace("{x}", str(tile_x))
+            .replace("{y}", str(tile_y))
+            .replace("{-y}", str(2 ** zoom - 1 - tile_y)))
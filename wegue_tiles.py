@@ -0,0 +1,149 @@
+"""
+Rendering of QGIS layers into XYZ tile directories
+
+Used for layers that Wegue can't load directly, e.g. local rasters.
+The tiles are rendered with the QGIS styling of the layer. Several
+map renderer jobs run at the same time, one per CPU core. Tiles that
+already exist are skipped, so an interrupted run can be resumed.
+"""
+
+import os
+
+from qgis.PyQt.QtCore import QEventLoop, QSize, QThread
+from qgis.PyQt.QtGui import QColor
+from qgis.core import (QgsCoordinateReferenceSystem,
+                       QgsCoordinateTransform,
+                       QgsMapRendererParallelJob,
+                       QgsMapSettings,
+                       QgsRectangle)
+
+from .wegue_tilemath import TILE_SIZE, tile_bounds, tile_range
+
+# providers of layers served by remote services, not rendered by default
+REMOTE_PROVIDERS = ("wms", "wfs", "wcs", "arcgismapserver",
+                    "arcgisfeatureserver")
+
+
+def layer_extent_3857(layer, qgis_instance):
+    """Returns the extent of a layer as [minx, miny, maxx, maxy]"""
+
+    xform = QgsCoordinateTransform(layer.crs(),
+                                   QgsCoordinateReferenceSystem("EPSG:3857"),
+                                   qgis_instance)
+    rect = xform.transformBoundingBox(layer.extent())
+    return [rect.xMinimum(), rect.yMinimum(),
+            rect.xMaximum(), rect.yMaximum()]
+
+
+def intersect_extents(a, b):
+    """Returns the intersection of two extents or None if disjoint"""
+
+    result = [max(a[0], b[0]), max(a[1], b[1]),
+              min(a[2], b[2]), min(a[3], b[3])]
+    if result[0] >= result[2] or result[1] >= result[3]:
+        return None
+    return result
+
+
+def count_tiles(extents, min_zoom, max_zoom):
+    """
+    Returns the number of tiles covering the extents over a zoom range,
+    computed from the tile ranges without listing the tiles
+    """
+
+    total = 0
+    for extent in extents:
+        for zoom in range(min_zoom, max_zoom + 1):
+            min_x, min_y, max_x, max_y = tile_range(extent, zoom)
+            total += (max_x - min_x + 1) * (max_y - min_y + 1)
+    return total
+
+
+class TileRenderer:
+    """Renders tile pyramids of several layers with parallel jobs"""
+
+    def __init__(self, qgis_instance, max_jobs=None):
+        self.qgis_instance = qgis_instance
+        self.max_jobs = max_jobs or max(QThread.idealThreadCount(), 1)
+        self.rendered = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def _map_settings(self, layer):
+        settings = QgsMapSettings()
+        settings.setLayers([layer])
+        settings.setDestinationCrs(
+            QgsCoordinateReferenceSystem("EPSG:3857"))
+        settings.setTransformContext(self.qgis_instance.transformContext())
+        settings.setOutputSize(QSize(TILE_SIZE, TILE_SIZE))
+        settings.setOutputDpi(96)
+        settings.setBackgroundColor(QColor(255, 255, 255, 0))
+        settings.setFlag(QgsMapSettings.Antialiasing, True)
+        # avoids labels being cut at the tile borders
+        settings.setFlag(QgsMapSettings.RenderMapTile, True)
+        return settings
+
+    def _tiles(self, tasks, min_zoom, max_zoom):
+        """Yields (map settings, tile path) of all missing tiles"""
+
+        for layer, out_dir, extent in tasks:
+            settings = self._map_settings(layer)
+            for zoom in range(min_zoom, max_zoom + 1):
+                min_x, min_y, max_x, max_y = tile_range(extent, zoom)
+                for tile_x in range(min_x, max_x + 1):
+                    tile_dir = os.path.join(out_dir, str(zoom), str(tile_x))
+                    for tile_y in range(min_y, max_y + 1):
+                        path = os.path.join(tile_dir, "{}.png".format(tile_y))
+                        if os.path.exists(path):
+                            self.skipped += 1
+                            continue
+                        tile_settings = QgsMapSettings(settings)
+                        tile_settings.setExtent(QgsRectangle(
+                            *tile_bounds(zoom, tile_x, tile_y)))
+                        yield tile_settings, path
+
+    def render(self, tasks, min_zoom, max_zoom):
+        """
+        Renders all tiles of the given tasks
+
+        tasks: list of (layer, output directory, extent in EPSG:3857)
+        """
+
+        tiles = self._tiles(tasks, min_zoom, max_zoom)
+        loop = QEventLoop()
+        running = set()
+
+        def start_next():
+            for settings, path in tiles:
+                job = QgsMapRendererParallelJob(settings)
+                job.finished.connect(
+                    lambda job=job, path=path: job_finished(job, path))
+                running.add(job)
+                job.start()
+                return True
+            return False
+
+        def job_finished(job, path):
+            running.discard(job)
+            self._save(job, path)
+            if not start_next() and not running:
+                loop.quit()
+
+        for _ in range(self.max_jobs):
+            if not start_next():
+                break
+
+        if running:
+            loop.exec_()
+
+    def _save(self, job, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write to a temporary file first, so an interrupted run
+        # never leaves broken tiles behind
+        tmp_path = path + ".part"
+        if job.renderedImage().save(tmp_path, "PNG"):
+            os.replace(tmp_path, path)
+            self.rendered += 1
+        else:
+            self.failed += 1
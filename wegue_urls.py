@@ -0,0 +1,44 @@
+import os.path
+from urllib.parse import (parse_qsl,
+                          unquote,
+                          urlencode,
+                          urlsplit,
+                          urlunsplit)
+
+
+def build_url(url, params):
+    """
+    Adds query parameters to a URL
+
+    Existing parameters with the same name (case insensitive) are
+    replaced, all others are kept.
+    """
+
+    parts = urlsplit(url)
+    names = {key.lower() for key in params}
+    query = [(key, value) for key, value in parse_qsl(parts.query)
+             if key.lower() not in names]
+    query.extend(params.items())
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def is_remote(url):
+    """Whether a layer URL points to a HTTP(S) server"""
+
+    return urlsplit(url).scheme in ("http", "https")
+
+
+def local_path(url, base_dir):
+    """
+    Returns the file system path of a layer URL or None for remote URLs
+
+    Relative URLs are resolved against base_dir, usually the directory
+    of the configuration.
+    """
+
+    if is_remote(url):
+        return None
+    parts = urlsplit(url)
+    if parts.scheme == "file":
+        return unquote(parts.path)
+    return os.path.join(base_dir, url)
@@ -1,12 +1,41 @@
 import re
-from owslib.wms import WebMapService
-from .wegueConfUtils import (create_vector_layer,
-                             create_wfs,
-                             create_wms,
-                             create_xyz)
-from urllib.parse import parse_qs
-from qgis.core import (QgsCoordinateTransform,
-                       QgsCoordinateReferenceSystem)
+from functools import partial
+from .wegue_capabilities import CapabilitiesParser
+from .wegue_convert import (LayerDescriptor,
+                            convert_layer,
+                            required_services,
+                            wfs_hits_url,
+                            wms_capabilities_url)
+from .wegue_network import get_background_session, get_session
+from qgis.PyQt.QtCore import QEventLoop
+from qgis.core import (Qgis,
+                       QgsCoordinateTransform,
+                       QgsCoordinateReferenceSystem,
+                       QgsMessageLog,
+                       QgsRectangle,
+                       QgsVectorLayer)
+
+# parsed WMS capabilities by (service URL, authcfg), see wegue_capabilities
+# kept for the whole QGIS session, so repeated exports don't refetch them
+_wms_capabilities_cache = {}
+
+# transformations to EPSG:3857 by source CRS and transform context
+_transform_cache = {}
+
+# number of features by (WFS URL, type name, authcfg), None if unknown
+_wfs_feature_count_cache = {}
+
+# cache keys of services currently requested in the background
+_in_flight = set()
+
+# functions called whenever background requests are finished
+_in_flight_listeners = []
+
+# providers whose layers need requests before the conversion
+SERVICE_PROVIDERS = ("wms", "wfs")
+
+_FEATURE_COUNT_PATTERN = re.compile(
+    rb'(?:numberMatched|numberOfFeatures)\s*=\s*["\'](\d+)["\']')
 
 
 def rgb2hex(r, g, b):
@@ -18,23 +47,97 @@ def rgb2hex(r, g, b):
     return "#{:02x}{:02x}{:02x}".format(r, g, b)
 
 
-def center2webmercator(center_point, qgis_instance):
-    """Converts a point geometry to EPSG:3857"""
+def _transform_context_key(context):
+    """
+    Returns a hashable summary of the coordinate operations a project
+    prescribes, so projects with other datum transformations don't
+    share a cached transformation
+    """
+
+    try:
+        # QGIS >= 3.8
+        operations = context.coordinateOperations()
+    except AttributeError:
+        operations = context.sourceDestinationDatumTransforms()
+    return tuple(sorted((repr(pair), repr(operation))
+                        for pair, operation in operations.items()))
+
+
+def get_webmercator_transform(qgis_instance):
+    """
+    Returns a transformation from the project CRS to EPSG:3857
+
+    Transformations are cached per source CRS and transform context of
+    the project, so repeated exports don't have to set up the same
+    transformation again.
+    """
 
     crs_source = qgis_instance.crs()
+    key = (crs_source.authid() or crs_source.toWkt(),
+           _transform_context_key(qgis_instance.transformContext()))
+
+    if key not in _transform_cache:
+        # define WebMercator(EPSG:3857)
+        crs_destination = QgsCoordinateReferenceSystem("EPSG:3857")
 
-    # define WebMercator(EPSG:3857)
-    crs_destination = QgsCoordinateReferenceSystem("EPSG:3857")
+        _transform_cache[key] = QgsCoordinateTransform(
+            crs_source, crs_destination, qgis_instance)
 
-    # transformation object
-    xform = QgsCoordinateTransform(crs_source,
-                                   crs_destination,
-                                   qgis_instance)
+    return _transform_cache[key]
+
+
+def center2webmercator(center_point, qgis_instance):
+    """Converts a point geometry to EPSG:3857"""
+
+    xform = get_webmercator_transform(qgis_instance)
 
     # forward transformation: src -> dest
     return xform.transform(center_point)
 
 
+def extent2webmercator(extent, qgis_instance):
+    """Converts a rectangle to [minx, miny, maxx, maxy] in EPSG:3857"""
+
+    xform = get_webmercator_transform(qgis_instance)
+    rect = xform.transformBoundingBox(extent)
+    return [rect.xMinimum(), rect.yMinimum(),
+            rect.xMaximum(), rect.yMaximum()]
+
+
+def project_view_extent(qgis_instance):
+    """
+    Returns the extent to export when no map canvas is available
+
+    This is the default view extent of the project or, if that is not
+    set, the combined extent of all layers. Both in the project CRS.
+    """
+
+    view_settings = qgis_instance.viewSettings()
+    extent = QgsRectangle(view_settings.defaultViewExtent())
+    if not extent.isEmpty():
+        xform = QgsCoordinateTransform(
+            view_settings.defaultViewExtent().crs(), qgis_instance.crs(),
+            qgis_instance)
+        return xform.transformBoundingBox(extent)
+
+    extent = QgsRectangle()
+    extent.setMinimal()
+    for layer in qgis_instance.mapLayers().values():
+        xform = QgsCoordinateTransform(
+            layer.crs(), qgis_instance.crs(), qgis_instance)
+        extent.combineExtentWith(xform.transformBoundingBox(layer.extent()))
+    return extent
+
+
+def extent2scale(extent_3857, width_px=1280):
+    """
+    Returns the scale at which an extent in EPSG:3857 fills a map
+    of the given width, assuming the OGC pixel size of 0.28 mm
+    """
+
+    return (extent_3857[2] - extent_3857[0]) / width_px / 0.00028
+
+
 def scale2zoom(scale):
     """Returns approximate zoom level for webmaps"""
 
@@ -70,26 +173,158 @@ def scale2zoom(scale):
     return scale_dict[closest_scale]
 
 
-def get_wfs_properties(source):
-    """Extracts the WFS properties from the layer source"""
+def _missing_requests(wms, wfs):
+    """
+    Returns the requests for services neither cached nor already
+    requested in the background, grouped by authcfg
+    """
+
+    batches = {}
+    for key, authcfg in wms.items():
+        if key not in _wms_capabilities_cache and key not in _in_flight:
+            # parsed while downloading, see _store_get_map_url
+            parser = CapabilitiesParser(
+                operations=("GetMap", "GetLegendGraphic"))
+            request = ("GET", wms_capabilities_url(key[0]), None,
+                       parser.feed)
+            batches.setdefault(authcfg, []).append(
+                (partial(_store_get_map_url, parser), key, request))
+    for key, props in wfs.items():
+        if key not in _wfs_feature_count_cache and key not in _in_flight:
+            batches.setdefault(props.get("authcfg"), []).append(
+                (_store_feature_count, key, wfs_hits_url(props)))
+    return batches
+
+
+def resolve_services(descriptors):
+    """
+    Requests everything the conversion of the descriptors needs from the
+    network: GetMap URLs of WMS and feature counts of WFS layers
+
+    All requests run concurrently, results are cached for the session.
+    Returns the services dict expected by wegue_convert.convert_layer.
+    """
+
+    wms, wfs = required_services(descriptors)
+
+    # requests started by prefetch_services are not sent twice,
+    # failed ones are tried again below
+    _wait_for_prefetch(set(wms) | set(wfs))
+
+    # each group is sent as one concurrent batch
+    for authcfg, batch in _missing_requests(wms, wfs).items():
+        session = get_session().with_authcfg(authcfg)
+        responses = session.fetch_all([request for _, _, request in batch])
+        for (store, key, _), response in zip(batch, responses):
+            store(key, response)
+
+    return {
+        "get_map_urls": {
+            key: _wms_capabilities_cache[key]["operations"]["GetMap"]
+            if key in _wms_capabilities_cache else None
+            for key in wms},
+        "feature_counts": {
+            key: _wfs_feature_count_cache.get(key) for key in wfs}
+    }
+
+
+def legend_endpoints():
+    """
+    Returns the GetLegendGraphic URL of every cached WMS by its GetMap
+    URL, the GetMap URL itself for services not listing the operation
+    """
+
+    endpoints = {}
+    for capabilities in _wms_capabilities_cache.values():
+        operations = capabilities["operations"]
+        endpoints[operations["GetMap"]] = operations.get(
+            "GetLegendGraphic", operations["GetMap"])
+    return endpoints
+
+
+def prefetch_services(descriptors):
+    """
+    Starts background requests for everything the conversion of the
+    descriptors will need and returns immediately
+
+    Results end up in the same caches resolve_services uses. Services
+    already cached or requested are skipped.
+    """
+
+    wms, wfs = required_services(descriptors)
+
+    for authcfg, batch in _missing_requests(wms, wfs).items():
+        _in_flight.update(key for _, key, _ in batch)
+        session = get_background_session().with_authcfg(authcfg)
+        session.fetch_async(
+            [request for _, _, request in batch],
+            lambda responses, batch=batch: _prefetch_done(batch, responses))
+
+
+def _prefetch_done(batch, responses):
+    for (store, key, _), response in zip(batch, responses):
+        store(key, response)
+        _in_flight.discard(key)
+
+    for listener in list(_in_flight_listeners):
+        listener()
+
+
+def _wait_for_prefetch(keys):
+    """Waits until none of the keys is requested in the background"""
+
+    if not keys & _in_flight:
+        return
+
+    loop = QEventLoop()
+
+    def check():
+        if not keys & _in_flight:
+            loop.quit()
+
+    _in_flight_listeners.append(check)
+    try:
+        loop.exec_()
+    finally:
+        _in_flight_listeners.remove(check)
+
+
+def _store_get_map_url(parser, key, response):
+    """
+    Caches the GetMap and, if offered, GetLegendGraphic URL of a
+    capabilities response by (service URL, authcfg)
+
+    The parser was fed the document while it was downloaded. The
+    download is aborted right after the request section, the layer tree
+    of large services is neither transferred nor read.
+    """
 
-    # manually converting source into dict
-    source = source.strip()
-    items = source.split(" ")
+    try:
+        response.raise_for_error()
+        capabilities = parser.close()
+        if "GetMap" not in capabilities["operations"]:
+            raise ValueError("no GetMap operation")
+    except Exception as e:
+        # not cached, the next export tries again
+        QgsMessageLog.logMessage(
+            "Could not read capabilities of '{}': {}".format(key[0], e),
+            "QGIS2Wegue", Qgis.Warning)
+        return
 
-    # built property dict
-    props = {}
-    for i in items:
-        # extract keys and values
-        spl = i.split("=")
-        k, v = spl[0], spl[1]
+    _wms_capabilities_cache[key] = capabilities
 
-        # remove single quote
-        v = v.replace("'", "")
 
-        # handle keys that appear
-        props[k] = v
-    return props
+def _store_feature_count(key, response):
+    """Parses a resultType=hits response and caches the count"""
+
+    if not response.ok:
+        # not cached, the next export tries again
+        return
+
+    # the count is an attribute of the root element,
+    # servers not reporting it are cached as unknown (None)
+    match = _FEATURE_COUNT_PATTERN.search(response.content[:4096])
+    _wfs_feature_count_cache[key] = int(match.group(1)) if match else None
 
 
 def get_geometry_type_name(layer):
@@ -110,98 +345,72 @@ def get_geometry_type_name(layer):
     return result
 
 
-def extract_wegue_layer_config(layer):
+def layer_group(node):
     """
-    Extracts all relevant information from a QGIS layer
-    and converts it to a Wegue layer configuration
+    Returns the path of the groups a layer tree node is in,
+    e.g. "Base/Roads", or None for layers at the top level
     """
 
-    providerType = layer.providerType().lower()
-    source = layer.source()
-
-    # same for all types
-    name = layer.name()
-
-    if providerType == "wms":
-        # Raster layer distinction proudly taken from the great qgis2web
-        # project. All credits to the qgis2web devs
-        # https://github.com/tomchadwin/qgis2web
-        layer_props = parse_qs(source)
-
-        # XYZ
-        if "type" in layer_props and layer_props["type"][0] == "xyz":
-            url = layer_props["url"][0]
-
-            # in case no attribution is available
-            attributions = ""
-            if "referer" in layer_props:
-                attributions = layer_props["referer"][0]
-
-            return create_xyz(
-                name, url, attributions=attributions)
-
-        # WMTS - currently not supported in Wegue
-        elif "tileMatrixSet" in layer_props:
-            pass
-
-        # WMS
-        else:
-
-            d = parse_qs(source)
+    names = []
+    parent = node.parent()
+    while parent is not None and parent.parent() is not None:
+        names.append(parent.name())
+        parent = parent.parent()
+    return "/".join(reversed(names)) or None
 
-            url_get_capabilities = d['url'][0]
-            layers_wms_property = d['layers'][0]
 
-            # request getMap URL via OWSLib
-            wms = WebMapService(url_get_capabilities)
-            url_get_map = wms.getOperationByName('GetMap').methods[0]['url']
+def describe_layer(layer, visible=True, group=None):
+    """
+    Extracts the plain data of a QGIS layer for the conversion
 
-            return create_wms(name, url_get_map, layers_wms_property)
+    visible and group describe the state of the layer in the layer
+    tree, see layer_group.
+    """
 
-    # KML or GeoJSON
-    elif providerType == "ogr":
+    geometry_type = ""
+    extent = None
+    if isinstance(layer, QgsVectorLayer):
+        geometry_type = get_geometry_type_name(layer)
 
-        url = source.split("|")[0]
+        source_extent = layer.sourceExtent()
+        extent = [source_extent.xMinimum(), source_extent.yMinimum(),
+                  source_extent.xMaximum(), source_extent.yMaximum()]
 
-        if(url.endswith(".kml") |
-                url.endswith(".json") |
-                url.endswith(".geojson")):
+    min_scale = max_scale = None
+    if layer.hasScaleBasedVisibility():
+        min_scale = layer.minimumScale() or None
+        max_scale = layer.maximumScale() or None
 
-            url = source.split("|")[0]
+    return LayerDescriptor(layer.providerType(), layer.source(),
+                           layer.name(), geometry_type, extent,
+                           min_scale, max_scale, visible, group)
 
-            geometry_type_name = get_geometry_type_name(layer)
 
-            formatMapping = "GeoJSON"
-            if url.endswith(".kml"):
-                formatMapping = "KML"
+def describe_service_layer(layer):
+    """
+    Extracts what resolve_services needs from a WMS or WFS layer
 
-            return create_vector_layer(
-                name, url, formatMapping,
-                geometryTypeName=geometry_type_name)
+    Only provider type, source and name are read. Unlike describe_layer
+    this never touches the data of the layer, e.g. the extent of a
+    vector layer, which can mean a scan of the whole table. Returns
+    None for layers of other providers.
+    """
 
-    # WFS
-    elif providerType == "wfs":
+    if layer.providerType() not in SERVICE_PROVIDERS:
+        return None
+    return LayerDescriptor(layer.providerType(), layer.source(),
+                           layer.name())
 
-        props = get_wfs_properties(source)
 
-        typename = props["typename"]
-        url = props["url"]
+def extract_wegue_layer_config(layer, wfs_thresholds=None):
+    """
+    Extracts all relevant information from a QGIS layer
+    and converts it to a Wegue layer configuration
 
-        geometry_type_name = get_geometry_type_name(layer)
+    wfs_thresholds: feature count thresholds for the WFS loading
+    strategy, see wfs_loading_props
+    """
 
-        # Extent
-        source_extent = layer.sourceExtent()
-        minx = source_extent.xMinimum()
-        miny = source_extent.yMinimum()
-        maxx = source_extent.xMaximum()
-        maxy = source_extent.yMaximum()
-        extent = [minx, miny, maxx, maxy]
-
-        return create_wfs(
-            name, url, typename,
-            geometryTypeName=geometry_type_name,
-            extent=extent)
-
-    # Provider Type not supported
-    else:
-        return None
+    descriptor = describe_layer(layer)
+    services = resolve_services([descriptor])
+    return convert_layer(descriptor, services, wfs_thresholds)
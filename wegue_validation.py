@@ -0,0 +1,334 @@
+"""
+Validation of generated Wegue configurations
+
+The schema is written as a small subset of JSON Schema and compiled once
+into nested check functions. The compiled validator is reused for every
+export, so validating a configuration is a single pass over the data.
+"""
+
+from .wegue_model import SlotsModel
+
+_LAYER_TYPES = ["WMS", "XYZ", "VECTOR", "WFS"]
+
+_STYLE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "radius": {"type": "number", "minimum": 0},
+        "strokeColor": {"type": "string"},
+        "strokeWidth": {"type": "number", "minimum": 0},
+        "fillColor": {"type": "string"}
+    }
+}
+
+_EXTENT_SCHEMA = {
+    "type": "array",
+    "minItems": 4,
+    "maxItems": 4,
+    "items": {"type": "number"}
+}
+
+LAYER_SCHEMA = {
+    "type": "object",
+    "required": ["type", "lid", "name", "url"],
+    "properties": {
+        "type": {"type": "string", "enum": _LAYER_TYPES},
+        "name": {"type": "string", "minLength": 1},
+        "url": {"type": "string", "minLength": 1},
+        "lid": {"type": "string", "minLength": 1},
+        "visible": {"type": "boolean"},
+        "group": {"type": "string", "minLength": 1},
+        "format": {"type": "string", "enum": ["GeoJSON", "KML"]},
+        "layers": {"type": "string", "minLength": 1},
+        "typeName": {"type": "string", "minLength": 1},
+        "attributions": {"type": "string"},
+        "extent": _EXTENT_SCHEMA,
+        "style": _STYLE_SCHEMA,
+        "loadOnlyVisible": {"type": "boolean"},
+        "minResolution": {"type": "number", "minimum": 0},
+        "maxResolution": {"type": "number", "minimum": 0},
+        "legendUrl": {"type": "string", "minLength": 1}
+    },
+    "additionalProperties": False,
+    "discriminator": {
+        "property": "type",
+        "mapping": {
+            "WMS": {"required": ["layers"]},
+            "WFS": {"required": ["typeName"]},
+            "VECTOR": {"required": ["format"]}
+        }
+    }
+}
+
+MODULE_SCHEMA = {
+    "type": "object",
+    "required": ["target"],
+    "properties": {
+        "target": {"type": "string", "enum": ["menu", "toolbar"]},
+        "win": {"type": "string"},
+        "icon": {"type": "string"},
+        "draggable": {"type": "boolean"},
+        "darkLayout": {"type": "boolean"}
+    }
+}
+
+WEGUE_CONF_SCHEMA = {
+    "type": "object",
+    "required": ["colorTheme", "mapZoom", "mapCenter", "mapLayers",
+                 "modules"],
+    "properties": {
+        "colorTheme": {"type": "object"},
+        "logo": {"type": "string"},
+        "logoSize": {"type": "integer", "minimum": 0},
+        "showCopyrightYear": {"type": "boolean"},
+        "mapZoom": {"type": "integer", "minimum": 0, "maximum": 28},
+        "mapCenter": {
+            "type": "array",
+            "minItems": 2,
+            "maxItems": 2,
+            "items": {"type": "number"}
+        },
+        "mapLayers": {
+            "type": "array",
+            "items": LAYER_SCHEMA,
+            "uniqueBy": "lid"
+        },
+        "modules": {
+            "type": "object",
+            "additionalProperties": MODULE_SCHEMA
+        },
+        "mapGeodataDragDop": {"type": "object"},
+        "permalink": {"type": "object"},
+        "overviewMap": {"type": "object"},
+        "viewAnimation": {"type": "object"}
+    },
+    "additionalProperties": False
+}
+
+
+# python types accepted for each schema type
+# booleans are ints in python, so they are rejected explicitly where needed
+_TYPES = {
+    "object": ((dict, SlotsModel), False),
+    "array": ((list, tuple), False),
+    "string": (str, False),
+    "integer": (int, True),
+    "number": ((int, float), True),
+    "boolean": (bool, False)
+}
+
+
+def format_path(path):
+    """
+    Converts an internal path into a readable string
+    like ``mapLayers[3].lid``
+    """
+
+    parts = []
+    while path is not None:
+        path, key = path
+        parts.append(key)
+
+    result = ""
+    for key in reversed(parts):
+        if isinstance(key, int):
+            result += "[{}]".format(key)
+        elif result:
+            result += "." + key
+        else:
+            result = key
+    return result or "<root>"
+
+
+def compile_schema(schema):
+    """
+    Compiles a schema into a check function
+
+    The returned function has the signature ``check(value, path, errors)``.
+    ``path`` is a linked ``(parent, key)`` tuple which is only converted
+    into a string when an error is found, so valid data costs nothing
+    beyond the type checks themselves.
+    """
+
+    checks = []
+
+    type_name = schema.get("type")
+    if type_name is not None:
+        python_types, reject_bool = _TYPES[type_name]
+
+    if "enum" in schema:
+        allowed = frozenset(schema["enum"])
+
+        def check_enum(value, path, errors):
+            if value not in allowed:
+                errors.append((path, "{!r} is not one of {}".format(
+                    value, sorted(allowed))))
+        checks.append(check_enum)
+
+    if "minLength" in schema:
+        min_length = schema["minLength"]
+
+        def check_min_length(value, path, errors):
+            if len(value) < min_length:
+                errors.append((path, "must have at least {} characters"
+                               .format(min_length)))
+        checks.append(check_min_length)
+
+    if "minimum" in schema or "maximum" in schema:
+        minimum = schema.get("minimum")
+        maximum = schema.get("maximum")
+
+        def check_range(value, path, errors):
+            if minimum is not None and value < minimum:
+                errors.append((path, "{} is lower than {}".format(
+                    value, minimum)))
+            if maximum is not None and value > maximum:
+                errors.append((path, "{} is greater than {}".format(
+                    value, maximum)))
+        checks.append(check_range)
+
+    if "minItems" in schema or "maxItems" in schema:
+        min_items = schema.get("minItems", 0)
+        max_items = schema.get("maxItems")
+
+        def check_length(value, path, errors):
+            length = len(value)
+            if length < min_items or (max_items is not None and
+                                      length > max_items):
+                errors.append((path, "has {} items, expected {}..{}".format(
+                    length, min_items,
+                    max_items if max_items is not None else "")))
+        checks.append(check_length)
+
+    if "items" in schema:
+        check_item = compile_schema(schema["items"])
+
+        def check_items(value, path, errors):
+            for index, item in enumerate(value):
+                check_item(item, (path, index), errors)
+        checks.append(check_items)
+
+    if "uniqueBy" in schema:
+        unique_key = schema["uniqueBy"]
+
+        def check_unique(value, path, errors):
+            seen = set()
+            for index, item in enumerate(value):
+                if (not isinstance(item, (dict, SlotsModel)) or
+                        unique_key not in item):
+                    continue
+                key = item[unique_key]
+                try:
+                    duplicate = key in seen
+                    seen.add(key)
+                except TypeError:
+                    # unhashable values are reported by the item schema
+                    continue
+                if duplicate:
+                    errors.append(((((path, index)), unique_key),
+                                   "duplicate value {!r}".format(key)))
+        checks.append(check_unique)
+
+    if "required" in schema:
+        required = tuple(schema["required"])
+
+        def check_required(value, path, errors):
+            if isinstance(value, SlotsModel):
+                # read the slots directly, a method call per key
+                # would cost more than the check itself
+                fields = value._field_set
+                for key in required:
+                    if key not in fields or getattr(value, key) is None:
+                        errors.append(((path, key), "is required"))
+                return
+            for key in required:
+                if key not in value:
+                    errors.append(((path, key), "is required"))
+        checks.append(check_required)
+
+    properties = schema.get("properties", {})
+    additional = schema.get("additionalProperties", True)
+    if properties or additional is not True:
+        # one pass over the keys of the value handles known and
+        # additional properties at the same time
+        property_checks = {
+            key: compile_schema(sub_schema)
+            for key, sub_schema in properties.items()}
+
+        if additional is True:
+            def check_extra(value, path, errors):
+                pass
+        elif additional is False:
+            def check_extra(value, path, errors):
+                errors.append((path, "is not allowed"))
+        else:
+            check_extra = compile_schema(additional)
+
+        def check_properties(value, path, errors):
+            for key, item in value.items():
+                (property_checks.get(key) or check_extra)(
+                    item, (path, key), errors)
+        checks.append(check_properties)
+
+    if "discriminator" in schema:
+        discriminator = schema["discriminator"]["property"]
+        mapping = {
+            key: compile_schema(sub_schema)
+            for key, sub_schema in
+            schema["discriminator"]["mapping"].items()}
+
+        def check_discriminator(value, path, errors):
+            if isinstance(value, SlotsModel):
+                variant = getattr(value, discriminator) \
+                    if discriminator in value._field_set else None
+            else:
+                variant = value.get(discriminator)
+            check_variant = mapping.get(variant)
+            if check_variant is not None:
+                check_variant(value, path, errors)
+        checks.append(check_discriminator)
+
+    checks = tuple(checks)
+
+    def type_error(value, path, errors):
+        errors.append((path, "expected {}, got {}".format(
+            type_name, type(value).__name__)))
+
+    # specialized variants keep the per value overhead low
+    if type_name is None:
+        def check(value, path, errors):
+            for sub_check in checks:
+                sub_check(value, path, errors)
+    elif not checks:
+        def check(value, path, errors):
+            if (not isinstance(value, python_types) or
+                    (reject_bool and value.__class__ is bool)):
+                type_error(value, path, errors)
+    else:
+        def check(value, path, errors):
+            if (not isinstance(value, python_types) or
+                    (reject_bool and value.__class__ is bool)):
+                type_error(value, path, errors)
+                return
+            for sub_check in checks:
+                sub_check(value, path, errors)
+
+    return check
+
+
+# compiled once on import and reused for every validation
+_check_wegue_conf = compile_schema(WEGUE_CONF_SCHEMA)
+
+
+def validate_wegue_conf(conf):
+    """
+    Validates a Wegue configuration against the schema
+
+    Accepts plain dicts as well as the typed configuration model.
+
+    Returns a list of ``(path, message)`` tuples, one for every error.
+    An empty list means the configuration is valid.
+    """
+
+    errors = []
+    _check_wegue_conf(conf, None, errors)
+    return [(format_path(path), message) for path, message in errors]
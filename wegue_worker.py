@@ -0,0 +1,176 @@
+"""
+Long-lived export worker
+
+Starts QGIS once and then exports any number of projects, so the
+startup of QGIS and its providers is paid only once. Capabilities and
+coordinate transformations stay cached between jobs.
+
+Run from the QGIS plugin directory (the parent of this package):
+
+    python -m qgis2wegue.wegue_worker            # jobs on stdin
+    python -m qgis2wegue.wegue_worker --socket /tmp/wegue.sock
+    python -m qgis2wegue.wegue_worker --port 8765
+
+Every job is one JSON line:
+
+    {"id": 1, "project": "a.qgs", "output": "a.json",
+     "options": {"modules": ["layer_list"], "probe": false}}
+
+For every job one JSON line with the result and the timings is
+written back. See wegue_export for the available options.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+import traceback
+
+from qgis.core import QgsApplication, QgsProject
+
+from .wegue_export import WegueExport
+from .wegue_util import (extent2scale,
+                         extent2webmercator,
+                         project_view_extent,
+                         scale2zoom)
+
+
+def start_qgis():
+    """Initializes QGIS without GUI"""
+
+    prefix_path = os.environ.get("QGIS_PREFIX_PATH")
+    if prefix_path:
+        QgsApplication.setPrefixPath(prefix_path, True)
+
+    app = QgsApplication([], False)
+    app.initQgis()
+    return app
+
+
+def run_job(job):
+    """Exports a single project and returns the result dict"""
+
+    start = time.perf_counter()
+    result = {"id": job.get("id"), "output": job.get("output")}
+
+    try:
+        qgis_instance = QgsProject.instance()
+        qgis_instance.clear()
+        if not qgis_instance.read(job["project"]):
+            raise IOError("Could not read project '{}': {}".format(
+                job["project"], qgis_instance.error()))
+        load_time = time.perf_counter() - start
+
+        options = job.get("options", {})
+        extent = project_view_extent(qgis_instance)
+        extent_3857 = extent2webmercator(extent, qgis_instance)
+        zoom_level = options.get("mapZoom", scale2zoom(
+            extent2scale(extent_3857, options.get("viewportWidth", 1280))))
+
+        export = WegueExport(qgis_instance, options)
+        export.run(extent, zoom_level, job["output"])
+
+        result["status"] = "ok"
+        result["written"] = export.written
+        result["layers"] = len(export.wegue_conf.mapLayers)
+        result["errors"] = [
+            {"path": path, "message": message}
+            for path, message in export.errors]
+        result["timings"] = dict(export.timings, load=round(load_time, 4))
+        if export.profiler is not None:
+            result["memory_peak"] = export.profiler.peak
+
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+        traceback.print_exc(file=sys.stderr)
+
+    result.setdefault("timings", {})["total"] = round(
+        time.perf_counter() - start, 4)
+    return result
+
+
+def serve_stream(lines, write):
+    """Runs the jobs of a stream of JSON lines and writes the results"""
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            result = {"status": "error", "error": "invalid job: {}".format(e)}
+        else:
+            if isinstance(job, dict):
+                result = run_job(job)
+            else:
+                result = {"status": "error",
+                          "error": "invalid job: expected a JSON object"}
+        write(json.dumps(result) + "\n")
+
+
+def serve_socket(server):
+    """Handles connections one after another, QGIS is single threaded"""
+
+    while True:
+        connection, _ = server.accept()
+        try:
+            with connection, \
+                    connection.makefile("rw", encoding="utf-8") as f:
+
+                def write(text):
+                    f.write(text)
+                    f.flush()
+
+                serve_stream(f, write)
+        except (BrokenPipeError, ConnectionResetError) as e:
+            # the client went away, keep serving the next ones
+            sys.stderr.write("Connection closed by client: {}\n".format(e))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export QGIS projects to Wegue configurations")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--socket", help="listen on a unix socket")
+    group.add_argument("--port", type=int,
+                       help="listen on a TCP port of localhost")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    app = start_qgis()
+    sys.stderr.write("QGIS started in {:.2f} s\n".format(
+        time.perf_counter() - start))
+
+    try:
+        if args.socket:
+            if os.path.exists(args.socket):
+                os.remove(args.socket)
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(args.socket)
+        elif args.port:
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind(("127.0.0.1", args.port))
+        else:
+            server = None
+
+        if server is None:
+            def write(text):
+                sys.stdout.write(text)
+                sys.stdout.flush()
+
+            serve_stream(sys.stdin, write)
+        else:
+            server.listen(1)
+            with server:
+                serve_socket(server)
+    finally:
+        app.exitQgis()
+
+
+if __name__ == "__main__":
+    main()